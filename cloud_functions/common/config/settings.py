@@ -30,8 +30,8 @@ class GoogleCloudSettings(BaseSettings):
     # DEPRECATED: embeddings/, metadata/, processed/ - Todo migrado a PostgreSQL
     
     # Nombres de archivos en GCS
-    gcs_metadata_name: str = 'metadata.csv'
-    gcs_metadata_summary_name: str = 'metadata_summary.csv'
+    gcs_metadata_name: str = 'metadata.parquet'
+    gcs_metadata_summary_name: str = 'metadata_summary.parquet'
     gcs_config_name: str = 'config.json'
 
     class Config:
@@ -46,6 +46,11 @@ class OpenAISettings(BaseSettings):
     openai_api_key: Optional[str] = Field(default=None, env='OPENAI_API_KEY')
     embedding_model: str = Field(default='text-embedding-3-small', env='EMBEDDING_MODEL')
     api_timeout: int = Field(default=30, env='API_TIMEOUT')
+    # Peticiones de embeddings simultáneas (batches en paralelo). Son I/O de
+    # red: los hilos esperan la respuesta sin retener el GIL
+    embedding_max_concurrency: int = Field(default=8, env='EMBEDDING_MAX_CONCURRENCY')
+    # Máximo de textos por petición de embeddings (la API admite hasta 2048)
+    embedding_batch_size: int = Field(default=2048, env='EMBED_BATCH_SIZE')
     
     # Configuración de generación de texto
     max_output_tokens: int = Field(default=2048, env='MAX_OUTPUT_TOKENS')
@@ -72,6 +77,10 @@ class ProcessingSettings(BaseSettings):
     
     # Configuración del dispositivo
     device: str = Field(default='cpu', env='DEVICE')
+    
+    # Pipeline fusionado: process_pdf_to_chunks genera los embeddings en la
+    # misma invocación, sin el artefacto intermedio en processed/
+    fused_pipeline: bool = Field(default=False, env='FUSED_PIPELINE')
 
     class Config:
         env_prefix = ''
@@ -299,6 +308,8 @@ GCF_PROJECT_ID = config.google_cloud.gcf_project_id
 OPENAI_API_KEY = config.openai.openai_api_key
 EMBEDDING_MODEL = config.openai.embedding_model
 API_TIMEOUT = config.openai.api_timeout
+EMBEDDING_MAX_CONCURRENCY = config.openai.embedding_max_concurrency
+EMBED_BATCH_SIZE = config.openai.embedding_batch_size
 MAX_OUTPUT_TOKENS = config.openai.max_output_tokens
 TEMPERATURE = config.openai.temperature
 TOP_P = config.openai.top_p
@@ -309,6 +320,7 @@ TEMP_DIR = config.processing.temp_dir
 PROCESSED_DIR = config.processing.processed_dir
 EMBEDDINGS_DIR = config.processing.embeddings_dir
 DEVICE = config.processing.device
+FUSED_PIPELINE = config.processing.fused_pipeline
 
 HOST = config.server.host
 PORT = config.server.port
@@ -3,6 +3,7 @@ Conexión a Cloud SQL PostgreSQL usando Cloud SQL Python Connector.
 """
 import os
 import logging
+import threading
 from google.cloud.sql.connector import Connector
 import sqlalchemy
 from sqlalchemy import create_engine
@@ -13,6 +14,12 @@ logger = logging.getLogger(__name__)
 # Variable global para el connector
 _connector = None
 
+# Engine y fábrica de sesiones compartidos por las invocaciones de una
+# instancia caliente (el pool de conexiones sobrevive entre invocaciones)
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
 def get_connector():
     """
     Obtiene una instancia singleton del Cloud SQL Connector.
@@ -51,7 +58,21 @@ def get_connection():
 
 def get_engine():
     """
-    Obtiene un engine de SQLAlchemy para Cloud SQL o PostgreSQL local.
+    Obtiene el engine compartido de SQLAlchemy (se crea en el primer uso).
+    
+    Returns:
+        Engine: Engine de SQLAlchemy
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine()
+    return _engine
+
+def _create_engine():
+    """
+    Crea un engine de SQLAlchemy para Cloud SQL o PostgreSQL local.
     
     Returns:
         Engine: Engine de SQLAlchemy
@@ -77,6 +98,7 @@ def get_engine():
             max_overflow=2,
             pool_timeout=30,
             pool_recycle=3600,
+            query_cache_size=1200,
             echo=True  # Habilitar debug para ver la conexión
         )
         
@@ -102,6 +124,7 @@ def get_engine():
         max_overflow=2,
         pool_timeout=30,
         pool_recycle=3600,
+        query_cache_size=1200,
         echo=False  # Set to True for debugging SQL queries
     )
     
@@ -115,9 +138,10 @@ def get_session():
     Returns:
         Session: Sesión de SQLAlchemy
     """
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(bind=get_engine())
+    return _session_factory()
 
 def test_connection():
     """
@@ -160,10 +184,9 @@ class DatabaseConnection:
         return self.connection
     
     def __exit__(self, exc_type, exc_val, exc_tb):
+        # El engine es compartido: cerrar la conexión la devuelve al pool
         if self.connection:
             self.connection.close()
-        if self.engine:
-            self.engine.dispose()
 
 # Función de conveniencia para usar con context manager
 def with_connection():
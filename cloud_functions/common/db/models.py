@@ -3,7 +3,7 @@ Modelos de SQLAlchemy para la base de datos de embeddings.
 """
 import logging
 from datetime import datetime
-from sqlalchemy import Table, Column, BigInteger, Text, DateTime, MetaData, Integer, String
+from sqlalchemy import Table, Column, BigInteger, Text, DateTime, MetaData, Integer, String, LargeBinary
 from sqlalchemy.orm import declarative_base
 from pgvector.sqlalchemy import Vector
 
@@ -15,14 +15,20 @@ Base = declarative_base()
 # Metadata para las tablas
 db_metadata = MetaData()
 
+# Número de particiones hash de la tabla embeddings (por document_id).
+# Las búsquedas filtradas y los borrados por documento solo tocan una partición.
+EMBEDDINGS_PARTITIONS = 16
+
 class EmbeddingModel(Base):
     """
     Modelo para la tabla de embeddings usando pgvector.
     """
     __tablename__ = "embeddings"
+    __table_args__ = {'postgresql_partition_by': 'HASH (document_id)'}
     
+    # La clave de partición debe formar parte de la clave primaria
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    document_id = Column(Text, nullable=False, index=True)
+    document_id = Column(Text, primary_key=True, nullable=False, index=True)
     chunk_id = Column(Text, nullable=False, index=True)
     text_content = Column(Text, nullable=False)
     embedding_vector = Column(Vector(1536), nullable=False)  # OpenAI text-embedding-3-small
@@ -59,17 +65,35 @@ class DocumentModel(Base):
     def __repr__(self):
         return f"<DocumentModel(id={self.id}, document_id='{self.document_id}', filename='{self.filename}')>"
 
+class EmbeddingCacheModel(Base):
+    """
+    Caché de embeddings por contenido, compartido entre documentos.
+    
+    La clave es SHA-256(modelo + "\\0" + texto): un texto ya embebido con el
+    mismo modelo no vuelve a enviarse a la API, aunque sea de otro documento.
+    """
+    __tablename__ = "embedding_cache"
+    
+    content_hash = Column(LargeBinary, primary_key=True)
+    model = Column(String(100), nullable=False)
+    embedding_vector = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<EmbeddingCacheModel(model='{self.model}', content_hash='{self.content_hash.hex()}')>"
+
 # Tabla de embeddings usando Table (alternativa a declarative)
 embeddings_table = Table(
     "embeddings",
     db_metadata,
     Column("id", BigInteger, primary_key=True, autoincrement=True),
-    Column("document_id", Text, nullable=False, index=True),
+    Column("document_id", Text, primary_key=True, nullable=False, index=True),
     Column("chunk_id", Text, nullable=False, index=True),
     Column("text_content", Text, nullable=False),
     Column("embedding_vector", Vector(1536), nullable=False),
     Column("created_at", DateTime, default=datetime.utcnow, nullable=False),
-    Column("updated_at", DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    Column("updated_at", DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False),
+    postgresql_partition_by='HASH (document_id)'
 )
 
 # Tabla de documentos usando Table (alternativa a declarative)
@@ -95,13 +119,22 @@ documents_table = Table(
     Column("updated_at", DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 )
 
+# Engines cuyas tablas ya fueron verificadas en este proceso
+_verified_engines = set()
+
 def create_tables(engine):
     """
     Crea todas las tablas en la base de datos.
     
+    La verificación se hace una sola vez por engine y proceso; las instancias
+    calientes no repiten las consultas de DDL en cada invocación.
+    
     Args:
         engine: Engine de SQLAlchemy
     """
+    if id(engine) in _verified_engines:
+        return
+    
     try:
         # Crear extensión pgvector si no existe
         from sqlalchemy import text
@@ -112,12 +145,43 @@ def create_tables(engine):
         
         # Crear tablas
         Base.metadata.create_all(engine)
+        create_embedding_partitions(engine)
+        _verified_engines.add(id(engine))
         logger.info("Tablas creadas exitosamente")
         
     except Exception as e:
         logger.error(f"Error al crear tablas: {str(e)}")
         raise
 
+def create_embedding_partitions(engine, num_partitions: int = EMBEDDINGS_PARTITIONS):
+    """
+    Crea las particiones hash de la tabla embeddings si no existen.
+    
+    Si la tabla fue creada antes del particionado (tabla regular), no se
+    modifica y se registra una advertencia.
+    
+    Args:
+        engine: Engine de SQLAlchemy
+        num_partitions (int): Número de particiones hash
+    """
+    from sqlalchemy import text
+    with engine.connect() as conn:
+        relkind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE relname = 'embeddings'")
+        ).scalar()
+        
+        if relkind != 'p':
+            logger.warning("La tabla embeddings no está particionada; se omite la creación de particiones")
+            return
+        
+        for remainder in range(num_partitions):
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS embeddings_p{remainder} PARTITION OF embeddings "
+                f"FOR VALUES WITH (MODULUS {num_partitions}, REMAINDER {remainder});"
+            ))
+        conn.commit()
+        logger.info(f"Particiones de embeddings verificadas/creadas: {num_partitions}")
+
 def drop_tables(engine):
     """
     Elimina todas las tablas de la base de datos.
@@ -127,6 +191,7 @@ def drop_tables(engine):
     """
     try:
         Base.metadata.drop_all(engine)
+        _verified_engines.discard(id(engine))
         logger.info("Tablas eliminadas exitosamente")
         
     except Exception as e:
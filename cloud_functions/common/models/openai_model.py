@@ -1,10 +1,13 @@
 """
 Implementación de modelos usando OpenAI.
 """
+import base64
 import logging
+import threading
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
+import httpx
 import openai
 
 from .base_model import BaseModel
@@ -12,6 +15,53 @@ from common.config.settings import API_TIMEOUT, MAX_OUTPUT_TOKENS, TEMPERATURE,
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexiones hacia la API: alcanza para los batches de embeddings
+# concurrentes sin repetir handshakes TCP+TLS
+OPENAI_MAX_CONNECTIONS = 32
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 16
+
+# Clientes compartidos por instancia, uno por configuración
+_openai_clients: Dict[tuple, openai.OpenAI] = {}
+_openai_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key: str, timeout: int = API_TIMEOUT,
+                      max_retries: int = openai.DEFAULT_MAX_RETRIES) -> openai.OpenAI:
+    """
+    Obtiene un cliente de OpenAI compartido con pool de conexiones.
+    
+    Se crea una sola vez por configuración: las invocaciones en caliente
+    reutilizan el cliente httpx y sus conexiones abiertas.
+    
+    Args:
+        api_key (str): API key de OpenAI
+        timeout (int): Timeout para las llamadas a la API
+        max_retries (int): Reintentos propios del cliente
+        
+    Returns:
+        openai.OpenAI: Cliente compartido
+    """
+    key = (api_key, timeout, max_retries)
+    client = _openai_clients.get(key)
+    if client is None:
+        with _openai_clients_lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                client = openai.OpenAI(
+                    api_key=api_key,
+                    timeout=timeout,
+                    max_retries=max_retries,
+                    http_client=httpx.Client(
+                        timeout=timeout,
+                        limits=httpx.Limits(
+                            max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                        )
+                    )
+                )
+                _openai_clients[key] = client
+    return client
+
 
 class OpenAIModel(BaseModel):
     """
@@ -29,7 +79,7 @@ class OpenAIModel(BaseModel):
             max_output_tokens (int): Número máximo de tokens en la respuesta
         """
         self.model_name = model_name
-        self.client = openai.OpenAI(api_key=api_key, timeout=timeout)
+        self.client = get_openai_client(api_key, timeout)
         self.max_output_tokens = max_output_tokens
         
     def generate(self, prompt: str, temperature: float = TEMPERATURE, top_p: float = TOP_P) -> str:
@@ -61,20 +111,24 @@ class OpenAIModel(BaseModel):
 class OpenAIEmbedding:
     """Servicio de generación de embeddings usando OpenAI."""
 
-    def __init__(self, model_name: str, api_key: str, timeout: int = API_TIMEOUT):
+    def __init__(self, model_name: str, api_key: str, timeout: int = API_TIMEOUT,
+                 client: Optional[openai.OpenAI] = None):
         """Inicializa el cliente de OpenAI para embeddings.
 
         Args:
             model_name (str): Nombre del modelo (p.ej. ``text-embedding-3-small``).
             api_key (str): API key de OpenAI.
             timeout (int): Tiempo máximo de espera para las llamadas a la API.
+            client (openai.OpenAI, optional): Cliente a reutilizar; por defecto el
+                compartido, sin reintentos propios (los maneja tenacity).
         """
         self.model_name = model_name
         self.api_key = api_key
         self.timeout = timeout
 
-        # Configurar cliente con la nueva API
-        self.client = openai.OpenAI(api_key=api_key, timeout=timeout)
+        # Cliente compartido: sin reintentos propios para no multiplicar los
+        # de tenacity en EmbeddingService
+        self.client = client or get_openai_client(api_key, timeout, max_retries=0)
 
         logger.info(f"Modelo de embeddings OpenAI inicializado: {model_name}")
 
@@ -92,21 +146,28 @@ class OpenAIEmbedding:
         normalize_embeddings = kwargs.get("normalize_embeddings", False)
 
         try:
+            # base64 transporta cada valor como float32 binario (~5 bytes en
+            # lugar de ~20 como texto JSON) y se decodifica sin listas de floats
             response = self.client.embeddings.create(
                 model=self.model_name,
                 input=texts,
-                encoding_format="float",
+                encoding_format="base64",
                 timeout=self.timeout,
             )
 
-            embeddings = [item.embedding for item in response.data]
-            embeddings_array = np.array(embeddings, dtype=np.float32)
+            # Cada item trae su posición en el input: se respeta ese orden
+            # aunque la respuesta llegue con otro
+            data = sorted(response.data, key=lambda item: item.index)
+            embeddings_array = np.vstack([
+                np.frombuffer(base64.b64decode(item.embedding), dtype='<f4')
+                for item in data
+            ])
 
             if normalize_embeddings:
                 norms = np.linalg.norm(embeddings_array, axis=1, keepdims=True)
                 embeddings_array = embeddings_array / norms
 
-            return embeddings_array if convert_to_numpy else embeddings
+            return embeddings_array if convert_to_numpy else embeddings_array.tolist()
 
         except Exception as e:
             logger.error(
@@ -2,4 +2,11 @@
 Módulo de servicios para el sistema DrCecim Upload.
 """
 
-from .vector_db_service import VectorDBService 
\ No newline at end of file
+
+def __getattr__(name):
+    # VectorDBService arrastra SQLAlchemy, pgvector y numpy: se importa al
+    # pedirlo, no al cargar cualquier otro servicio del paquete
+    if name == "VectorDBService":
+        from .vector_db_service import VectorDBService
+        return VectorDBService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
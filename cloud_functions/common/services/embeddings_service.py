@@ -11,7 +11,7 @@ Este módulo proporciona funcionalidades para:
 Dependencias:
 - openai: Para generar embeddings usando la API
 - pgvector: Para almacenamiento y búsqueda vectorial en PostgreSQL
-- pandas: Para manipulación de datos
+- pyarrow: Para manejo de metadatos en formato columnar
 - numpy: Para operaciones numéricas
 - tenacity: Para manejo de reintentos
 
@@ -21,17 +21,19 @@ Configuración:
 - API_TIMEOUT: Timeout para peticiones a la API
 """
 import os
+import hashlib
 import logging
-import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Any
-import pandas as pd
+from typing import List, Dict, Any, Optional
 import numpy as np
+import pyarrow as pa
 import json
 from datetime import datetime
 from tqdm import tqdm
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import openai
+import threading
 import time
 
 from common.models.openai_model import OpenAIEmbedding
@@ -39,13 +41,72 @@ from common.config.settings import (
     OPENAI_API_KEY, 
     EMBEDDING_MODEL, 
     API_TIMEOUT,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBED_BATCH_SIZE,
     TEMP_DIR
 )
 from common.services.vector_db_service import VectorDBService
+from common.utils.resource_managers import ProcessingCancelledError
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+# Tipos de las columnas de metadatos (ver create_metadata). Al leer CSV se
+# pasan explícitos para no inferirlos columna por columna.
+METADATA_DTYPES = {
+    'document_id': pa.string(),
+    'chunk_id': pa.string(),
+    'text': pa.string(),
+    'filename': pa.string(),
+    'chunk_index': pa.int32(),
+    'text_length': pa.int32(),
+    'word_count': pa.int32(),
+    'created_at': pa.string()
+}
+
+# Límites de una petición de embeddings de OpenAI: hasta 2048 textos y
+# 300.000 tokens en total. Los batches se arman por caracteres para no
+# depender de un tokenizador; con 2 caracteres por token (peor caso: tablas,
+# números) 400.000 caracteres siguen por debajo del límite
+EMBEDDING_MAX_INPUTS_PER_REQUEST = 2048
+EMBEDDING_MAX_CHARS_PER_REQUEST = 400_000
+
+# Veces que un batch rechazado por exceder los tokens por petición puede
+# partirse a la mitad (hasta 2^4 sub-batches)
+EMBEDDING_MAX_SPLIT_DEPTH = 4
+
+
+def _is_request_token_limit(error: "openai.BadRequestError") -> bool:
+    """
+    Indica si la API rechazó la petición por superar los tokens por petición.
+    
+    Otros BadRequestError (modelo inválido, parámetros, un texto que supera
+    por sí solo el contexto del modelo) no se resuelven dividiendo el batch.
+    
+    Args:
+        error (openai.BadRequestError): Error devuelto por la API
+        
+    Returns:
+        bool: True si dividir el batch puede resolverlo
+    """
+    if getattr(error, 'code', None) == 'max_tokens_per_request':
+        return True
+    return 'tokens per request' in str(error)
+
+
+def content_hash(text: str, model: str = EMBEDDING_MODEL) -> bytes:
+    """
+    Calcula la clave del caché de embeddings para un texto.
+    
+    Args:
+        text (str): Texto del chunk
+        model (str): Modelo de embeddings
+        
+    Returns:
+        bytes: SHA-256 de modelo + "\\0" + texto
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).digest()
+
 
 class EmbeddingService:
     """
@@ -70,12 +131,14 @@ class EmbeddingService:
         >>> logger.info(f"Generados {result['num_embeddings']} embeddings")
     """
     
-    def __init__(self, temp_dir: str = TEMP_DIR):
+    def __init__(self, temp_dir: str = TEMP_DIR, client: Optional[openai.OpenAI] = None):
         """
         Inicializa el servicio de embeddings.
         
         Args:
             temp_dir (str): Directorio temporal para archivos
+            client (openai.OpenAI, optional): Cliente de OpenAI a reutilizar
+                (por defecto el cliente compartido del módulo de modelos)
         """
         self.temp_dir = Path(temp_dir)
         self.temp_dir.mkdir(parents=True, exist_ok=True)
@@ -89,7 +152,8 @@ class EmbeddingService:
         self.model = OpenAIEmbedding(
             model_name=EMBEDDING_MODEL,
             api_key=OPENAI_API_KEY,
-            timeout=API_TIMEOUT
+            timeout=API_TIMEOUT,
+            client=client
         )
         
         self.embedding_dimension = self.model.get_sentence_embedding_dimension()
@@ -100,14 +164,18 @@ class EmbeddingService:
         self.vector_db = VectorDBService()
         logger.info("Servicio de base de datos vectorial inicializado")
     
-    def generate_embeddings(self, texts: List[str], batch_size: int = 16, use_batch_api: bool = False) -> np.ndarray:
+    def generate_embeddings(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE,
+                            use_batch_api: bool = False,
+                            cancel: Optional[threading.Event] = None) -> np.ndarray:
         """
         Genera embeddings para una lista de textos usando OpenAI.
         
         Args:
             texts (List[str]): Lista de textos a procesar
-            batch_size (int): Tamaño del batch para procesamiento
+            batch_size (int): Máximo de textos por petición a la API
             use_batch_api (bool): Si usar Batch API para lotes grandes (>10k)
+            cancel (Optional[threading.Event]): Si se marca, los batches
+                pendientes no se envían a la API
             
         Returns:
             np.ndarray: Array de embeddings
@@ -127,26 +195,170 @@ class EmbeddingService:
         # Preprocesar textos
         valid_texts = self._preprocess_texts(texts)
         
-        # Generar embeddings con OpenAI
-        embeddings = []
-        # OpenAI soporta batches más grandes, dividimos en bloques de 100 para seguridad
-        openai_batch_size = min(batch_size * 4, 100)
+        # Generar embeddings con OpenAI. Cada petición lleva tantos textos como
+        # permiten los límites de la API: menos round-trips y menos overhead
+        # por petición que con bloques fijos de pocos textos
+        batches = self._pack_batches(
+            valid_texts,
+            max_inputs=min(batch_size, EMBEDDING_MAX_INPUTS_PER_REQUEST),
+            max_chars=EMBEDDING_MAX_CHARS_PER_REQUEST
+        )
+        num_vectors = len(valid_texts)
+        all_embeddings = None
+        
+        max_workers = max(1, min(EMBEDDING_MAX_CONCURRENCY, len(batches)))
         
         try:
-            for i in tqdm(range(0, len(valid_texts), openai_batch_size), 
-                         desc="Generando embeddings con OpenAI"):
-                batch = valid_texts[i:i + openai_batch_size]
-                batch_embeddings = self._generate_batch_embeddings_with_retry(batch)
-                embeddings.append(batch_embeddings)
-            
-            # Concatenar y normalizar embeddings
-            all_embeddings = self._finalize_embeddings(embeddings)
-            return all_embeddings
+            # Las peticiones son I/O de red: varios batches en vuelo a la vez
+            # (cada uno con sus propios reintentos) en lugar de esperar cada
+            # respuesta antes de enviar el siguiente
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self._embed_batch, valid_texts[start:end], cancel): start
+                    for start, end in batches
+                }
+                
+                try:
+                    for future in tqdm(as_completed(futures), total=len(futures),
+                                       desc="Generando embeddings con OpenAI"):
+                        i = futures[future]
+                        batch_embeddings = future.result()
+                        # La matriz final se reserva una sola vez (con la dimensión
+                        # que devuelve la API) y cada batch se copia en su tramo
+                        if all_embeddings is None:
+                            all_embeddings = np.empty((num_vectors, batch_embeddings.shape[1]), dtype=np.float32)
+                        all_embeddings[i:i + len(batch_embeddings)] = batch_embeddings
+                except Exception:
+                    # No enviar los batches pendientes si uno falló (o se
+                    # canceló el procesamiento)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+            
+            # Normalizar embeddings
+            return self._finalize_embeddings(all_embeddings)
                 
         except Exception as e:
             logger.error(f"Error general en generación de embeddings con OpenAI: {str(e)}")
             raise
     
+    def generate_document_embeddings(self, texts: List[str], document_id: str,
+                                     cancel: Optional[threading.Event] = None) -> np.ndarray:
+        """
+        Genera embeddings reutilizando los ya calculados.
+        
+        Los textos repetidos dentro del documento (encabezados, pies de
+        página, índices) se procesan una sola vez y su embedding se replica
+        en cada posición.
+        
+        Args:
+            texts (List[str]): Lista de textos a procesar
+            document_id (str): ID del documento
+            cancel (Optional[threading.Event]): Evento de cancelación del procesamiento
+            
+        Returns:
+            np.ndarray: Array de embeddings en el orden de texts
+        """
+        if not texts:
+            return self.generate_embeddings(texts)
+        
+        # Posición de cada texto en la lista de textos únicos (una pasada O(n))
+        first_index = {}
+        positions = [first_index.setdefault(text, len(first_index)) for text in texts]
+        if len(first_index) == len(texts):
+            return self._generate_unique_embeddings(texts, document_id, cancel)
+        
+        logger.info(f"{len(texts) - len(first_index)} chunks repetidos en {document_id}; se omiten")
+        unique_embeddings = self._generate_unique_embeddings(list(first_index), document_id, cancel)
+        return unique_embeddings[positions]
+    
+    def _generate_unique_embeddings(self, texts: List[str], document_id: str,
+                                    cancel: Optional[threading.Event] = None) -> np.ndarray:
+        """
+        Genera embeddings para textos sin repetidos, reutilizando los ya calculados.
+        
+        Al reprocesar un documento, los chunks cuyo texto no cambió ya tienen
+        su embedding en PostgreSQL; el resto se busca en el caché por
+        contenido (compartido entre documentos). Solo los textos que no están
+        en ninguno se envían a la API, y se agregan al caché.
+        
+        Args:
+            texts (List[str]): Textos únicos a procesar
+            document_id (str): ID del documento
+            cancel (Optional[threading.Event]): Evento de cancelación del procesamiento
+            
+        Returns:
+            np.ndarray: Array de embeddings en el orden de texts
+        """
+        reused = {}
+        stored = self.vector_db.get_stored_embeddings(document_id, texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if text in stored:
+                reused[i] = stored[text]
+            else:
+                pending.append(i)
+        
+        # Una consulta al caché para todos los textos pendientes
+        hashes = [content_hash(texts[i]) for i in pending]
+        cached = self.vector_db.get_cached_embeddings(hashes, EMBEDDING_MODEL) if hashes else {}
+        missing, missing_hashes = [], []
+        for i, text_hash in zip(pending, hashes):
+            if text_hash in cached:
+                reused[i] = cached[text_hash]
+            else:
+                missing.append(i)
+                missing_hashes.append(text_hash)
+        
+        if reused:
+            logger.info(
+                f"Reutilizando {len(reused)} embeddings de {document_id} "
+                f"({len(texts) - len(pending)} del documento, {len(pending) - len(missing)} del caché); "
+                f"se generarán {len(missing)}"
+            )
+        
+        generated = None
+        if missing:
+            generated = self.generate_embeddings([texts[i] for i in missing], cancel=cancel)
+            self.vector_db.cache_embeddings(missing_hashes, EMBEDDING_MODEL, generated)
+            if not reused:
+                return generated
+        
+        dimension = generated.shape[1] if generated is not None else len(next(iter(reused.values())))
+        embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+        for i, vector in reused.items():
+            embeddings[i] = vector
+        if missing:
+            embeddings[missing] = generated
+        
+        return embeddings
+    
+    @staticmethod
+    def _pack_batches(texts: List[str], max_inputs: int, max_chars: int) -> List[tuple]:
+        """
+        Agrupa textos consecutivos en batches que respetan los límites de una petición.
+        
+        Args:
+            texts (List[str]): Textos a agrupar
+            max_inputs (int): Máximo de textos por batch
+            max_chars (int): Máximo de caracteres por batch
+            
+        Returns:
+            List[tuple]: Rangos (inicio, fin) de cada batch
+        """
+        batches = []
+        start = 0
+        batch_chars = 0
+        for i, text in enumerate(texts):
+            # Un texto nunca queda solo fuera de un batch, aunque supere max_chars
+            if i > start and (i - start >= max_inputs or batch_chars + len(text) > max_chars):
+                batches.append((start, i))
+                start, batch_chars = i, 0
+            batch_chars += len(text)
+        
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+    
     def _preprocess_texts(self, texts: List[str]) -> List[str]:
         """
         Preprocesa textos para asegurar que sean válidos para la API de OpenAI.
@@ -173,6 +385,42 @@ class EmbeddingService:
         
         return valid_texts
     
+    def _embed_batch(self, batch: List[str],
+                     cancel: Optional[threading.Event] = None, depth: int = 0) -> np.ndarray:
+        """
+        Genera embeddings para un batch, dividiéndolo si la API lo rechaza.
+        
+        Los batches se arman por caracteres, no por tokens: si un batch
+        supera igual el límite de tokens por petición, se parte a la mitad
+        (hasta EMBEDDING_MAX_SPLIT_DEPTH veces) en lugar de fallar el
+        documento completo. Cualquier otro BadRequestError se propaga.
+        
+        Args:
+            batch (List[str]): Batch de textos
+            cancel (Optional[threading.Event]): Si está marcado, el batch no
+                se envía
+            depth (int): Divisiones ya aplicadas a este batch
+            
+        Returns:
+            np.ndarray: Embeddings del batch, en el mismo orden
+            
+        Raises:
+            ProcessingCancelledError: Si se solicitó la cancelación
+        """
+        if cancel is not None and cancel.is_set():
+            raise ProcessingCancelledError("Generación de embeddings cancelada; batch pendiente omitido")
+        try:
+            return self._generate_batch_embeddings_with_retry(batch)
+        except openai.BadRequestError as e:
+            if len(batch) <= 1 or depth >= EMBEDDING_MAX_SPLIT_DEPTH or not _is_request_token_limit(e):
+                raise
+            middle = len(batch) // 2
+            logger.warning(f"Batch de {len(batch)} textos supera los tokens por petición; se divide en dos")
+            return np.vstack([
+                self._embed_batch(batch[:middle], cancel, depth + 1),
+                self._embed_batch(batch[middle:], cancel, depth + 1)
+            ])
+    
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -206,35 +454,36 @@ class EmbeddingService:
             logger.error(f"Error inesperado en batch: {str(e)}")
             raise
     
-    def _finalize_embeddings(self, embeddings: List[np.ndarray]) -> np.ndarray:
+    def _finalize_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
         """
-        Concatena y normaliza los embeddings finales.
+        Normaliza los embeddings finales.
         
         Args:
-            embeddings (List[np.ndarray]): Lista de arrays de embeddings
+            embeddings (np.ndarray): Matriz de embeddings
             
         Returns:
             np.ndarray: Array final de embeddings normalizados
         """
-        # Concatenar embeddings
-        all_embeddings = np.vstack(embeddings)
+        # Asegurar un único bloque float32 contiguo (sin copia si ya lo es)
+        all_embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
         
-        # Normalizar si es necesario
-        if np.any(np.sum(all_embeddings * all_embeddings, axis=1) > 1.0):
-            logger.info("Normalizando embeddings finales...")
-            all_embeddings = all_embeddings / np.sqrt(
-                np.sum(all_embeddings * all_embeddings, axis=1, keepdims=True)
-            )
+        # Normalizar una sola vez al escribir (in-place); las búsquedas por
+        # coseno ya no dependen de la norma de cada vector
+        # einsum calcula las normas sin materializar la matriz de cuadrados
+        # intermedia que crea np.linalg.norm (un recorrido de memoria menos)
+        norms = np.sqrt(np.einsum('ij,ij->i', all_embeddings, all_embeddings))
+        norms[norms == 0] = 1.0
+        all_embeddings /= norms[:, np.newaxis]
         
         return all_embeddings
     
-    def store_embeddings_in_db(self, embeddings: np.ndarray, metadata_df: pd.DataFrame) -> bool:
+    def store_embeddings_in_db(self, embeddings: np.ndarray, metadata: pa.Table) -> bool:
         """
         Almacena embeddings en la base de datos PostgreSQL.
         
         Args:
             embeddings (np.ndarray): Array de embeddings
-            metadata_df (pd.DataFrame): DataFrame con metadatos
+            metadata (pa.Table): Tabla de Arrow con metadatos
             
         Returns:
             bool: True si se almacenaron exitosamente
@@ -243,7 +492,7 @@ class EmbeddingService:
             logger.info(f"Almacenando {len(embeddings)} embeddings en PostgreSQL")
             
             # Usar el servicio de base de datos vectorial
-            success = self.vector_db.store_embeddings(embeddings, metadata_df)
+            success = self.vector_db.store_embeddings(embeddings, metadata)
             
             if success:
                 logger.info("Embeddings almacenados exitosamente en PostgreSQL")
@@ -257,7 +506,7 @@ class EmbeddingService:
             return False
     
     def create_metadata(self, texts: List[str], filenames: List[str], 
-                       chunk_indices: List[int]) -> pd.DataFrame:
+                       chunk_indices: List[int]) -> pa.Table:
         """
         Crea metadatos para los embeddings.
         
@@ -267,75 +516,113 @@ class EmbeddingService:
             chunk_indices (List[int]): Lista de índices de chunks
             
         Returns:
-            pd.DataFrame: DataFrame con metadatos
-        """
-        import uuid
-        from pathlib import Path
-        
-        # Crear IDs únicos para documento y chunks
-        document_ids = []
-        chunk_ids = []
-        
-        for filename in filenames:
-            # Crear document_id basado en el nombre del archivo (sin extensión)
-            document_id = Path(filename).stem
-            document_ids.append(document_id)
-            
-            # Crear chunk_id único combinando document_id y chunk_index
-            chunk_id = f"{document_id}_{chunk_indices[len(chunk_ids)]}"
-            chunk_ids.append(chunk_id)
-        
-        # Crear DataFrame con información adicional
-        metadata = pd.DataFrame({
-            'document_id': document_ids,
-            'chunk_id': chunk_ids,
-            'text': texts,
-            'filename': filenames,
-            'chunk_index': chunk_indices,
-            'text_length': [len(text) for text in texts],
-            'word_count': [len(text.split()) for text in texts],
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            pa.Table: Tabla de Arrow con metadatos
+        """
+        import pyarrow.compute as pc
+        
+        # document_id = nombre del archivo sin extensión; se calcula una vez por
+        # archivo distinto en lugar de por fila
+        stems = {filename: Path(filename).stem for filename in set(filenames)}
+        document_ids = [stems[filename] for filename in filenames]
+        
+        # chunk_id único combinando document_id y chunk_index
+        chunk_ids = [f"{document_id}_{chunk_index}"
+                     for document_id, chunk_index in zip(document_ids, chunk_indices)]
+        
+        texts_array = pa.array(texts, type=pa.string())
+        
+        # Crear la tabla directamente en formato columnar (sin BlockManager de pandas)
+        metadata = pa.table({
+            'document_id': pa.array(document_ids, type=pa.string()),
+            'chunk_id': pa.array(chunk_ids, type=pa.string()),
+            'text': texts_array,
+            'filename': pa.array(filenames, type=pa.string()),
+            'chunk_index': pa.array(chunk_indices, type=pa.int32()),
+            'text_length': pc.utf8_length(texts_array).cast(pa.int32()),
+            'word_count': pa.array([len(text.split()) for text in texts], type=pa.int32()),
+            'created_at': pa.array(
+                [datetime.now().strftime('%Y-%m-%d %H:%M:%S')] * len(texts), type=pa.string()
+            )
         })
         
         return metadata
     
-    def save_metadata(self, metadata: pd.DataFrame, filepath: str):
+    def save_metadata(self, metadata: pa.Table, filepath: str):
         """
-        Guarda metadatos en un archivo CSV.
+        Guarda metadatos en un archivo Parquet (o CSV si la ruta termina en .csv).
         
         Args:
-            metadata (pd.DataFrame): DataFrame con metadatos
+            metadata (pa.Table): Tabla de Arrow con metadatos
             filepath (str): Ruta donde guardar el archivo
         """
         try:
-            metadata.to_csv(filepath, index=False)
+            if str(filepath).endswith('.csv'):
+                # Compatibilidad con archivos de metadatos anteriores
+                import pyarrow.csv as pa_csv
+                pa_csv.write_csv(metadata, filepath)
+            else:
+                import pyarrow.parquet as pq
+                pq.write_table(metadata, filepath, compression='zstd')
             logger.info(f"Metadatos guardados en {filepath}")
         except Exception as e:
             logger.error(f"Error al guardar metadatos: {str(e)}")
             raise
     
-    def create_metadata_summary(self, metadata: pd.DataFrame) -> pd.DataFrame:
+    def load_metadata(self, filepath: str) -> pa.Table:
         """
-        Crea un resumen de metadatos por archivo.
+        Carga metadatos guardados con save_metadata (Parquet o CSV).
         
         Args:
-            metadata (pd.DataFrame): DataFrame con metadatos
+            filepath (str): Ruta del archivo de metadatos
             
         Returns:
-            pd.DataFrame: DataFrame con resumen
+            pa.Table: Tabla de Arrow con metadatos
         """
-        summary = metadata.groupby('filename').agg({
-            'chunk_index': 'count',
-            'text_length': ['sum', 'mean'],
-            'word_count': ['sum', 'mean']
-        }).reset_index()
+        try:
+            if str(filepath).endswith('.csv'):
+                # Lector multihilo de pyarrow y tipos explícitos (sin inferencia)
+                import pyarrow.csv as pa_csv
+                metadata = pa_csv.read_csv(
+                    filepath,
+                    convert_options=pa_csv.ConvertOptions(column_types=METADATA_DTYPES)
+                )
+            else:
+                import pyarrow.parquet as pq
+                metadata = pq.read_table(filepath)
+            logger.info(f"Metadatos cargados desde {filepath}: {metadata.num_rows} registros")
+            return metadata
+        except Exception as e:
+            logger.error(f"Error al cargar metadatos: {str(e)}")
+            raise
+    
+    def create_metadata_summary(self, metadata: pa.Table) -> pa.Table:
+        """
+        Crea un resumen de metadatos por archivo.
         
-        summary.columns = [
+        Args:
+            metadata (pa.Table): Tabla de Arrow con metadatos
+            
+        Returns:
+            pa.Table: Tabla de Arrow con resumen
+        """
+        summary = metadata.group_by('filename').aggregate([
+            ('chunk_index', 'count'),
+            ('text_length', 'sum'),
+            ('text_length', 'mean'),
+            ('word_count', 'sum'),
+            ('word_count', 'mean')
+        ])
+        
+        # El orden de las columnas de group_by varía entre versiones de pyarrow
+        summary = summary.select([
+            'filename', 'chunk_index_count', 'text_length_sum', 'text_length_mean',
+            'word_count_sum', 'word_count_mean'
+        ])
+        
+        return summary.rename_columns([
             'filename', 'num_chunks', 'total_chars', 'avg_chars_per_chunk',
             'total_words', 'avg_words_per_chunk'
-        ]
-        
-        return summary
+        ])
     
     def save_config(self, config: Dict[str, Any], filepath: str):
         """
@@ -353,15 +640,19 @@ class EmbeddingService:
             logger.error(f"Error al guardar configuración: {str(e)}")
             raise
     
-    def process_document_embeddings(self, processed_doc: Dict[str, Any]) -> Dict[str, Any]:
+    def process_document_embeddings(self, processed_doc: Dict[str, Any],
+                                    cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
         """
         Procesa un documento y genera embeddings para sus chunks.
         
         Args:
             processed_doc (Dict[str, Any]): Documento procesado con chunks
+            cancel (Optional[threading.Event]): Evento de cancelación del
+                procesamiento (ver with_processing_resources)
             
         Returns:
-            Dict[str, Any]: Diccionario con embeddings y metadatos
+            Dict[str, Any]: Diccionario con embeddings y metadatos (los
+                metadatos como dict de columnas: nombre -> lista de valores)
         """
         try:
             if not processed_doc.get('processed_successfully', False):
@@ -380,8 +671,9 @@ class EmbeddingService:
             
             logger.info(f"Procesando {len(texts)} chunks de {filename}")
             
-            # Generar embeddings
-            embeddings = self.generate_embeddings(texts)
+            # Generar embeddings (los chunks sin cambios de un documento ya
+            # procesado reutilizan el embedding almacenado)
+            embeddings = self.generate_document_embeddings(texts, Path(filename).stem, cancel)
             
             if embeddings.size == 0:
                 raise ValueError("No se generaron embeddings")
@@ -391,6 +683,8 @@ class EmbeddingService:
             metadata_summary = self.create_metadata_summary(metadata)
             
             # Almacenar embeddings en PostgreSQL
+            if cancel is not None and cancel.is_set():
+                raise ProcessingCancelledError("Procesamiento cancelado antes de almacenar embeddings")
             storage_success = self.store_embeddings_in_db(embeddings, metadata)
             
             if not storage_success:
@@ -421,7 +715,8 @@ class EmbeddingService:
             return {
                 'filename': filename,
                 'embeddings': embeddings,
-                'metadata': metadata.to_dict(orient='records'),
+                # Por columnas: una lista por columna en lugar de un dict por fila
+                'metadata': metadata.to_pydict(),
                 'metadata_summary': metadata_summary,
                 'config': config,
                 'processed_successfully': True,
@@ -449,32 +744,6 @@ class EmbeddingService:
             logger.error(f"Error al obtener estadísticas de la base de datos: {str(e)}")
             return {}
     
-    def cleanup_temp_files(self, directory: str = None):
-        """
-        Limpia archivos temporales.
-        
-        Args:
-            directory (str): Directorio específico a limpiar (opcional)
-        """
-        try:
-            if directory:
-                import shutil
-                shutil.rmtree(directory)
-                logger.info(f"Directorio temporal limpiado: {directory}")
-            else:
-                # Limpiar todo el directorio temporal
-                import shutil
-                if self.temp_dir.exists():
-                    shutil.rmtree(self.temp_dir)
-                    try:
-                        self.temp_dir.mkdir(parents=True, exist_ok=True)
-                    except (OSError, PermissionError):
-                        # Usar /tmp en Cloud Functions
-                        self.temp_dir = Path("/tmp")
-                    logger.info("Directorio temporal de embeddings limpiado")
-        except Exception as e:
-            logger.error(f"Error al limpiar archivos temporales: {str(e)}")
-
     def cleanup_processed_files(self, chunks_file_path: str) -> bool:
         """
         Limpia archivos procesados redundantes después de almacenar embeddings.
@@ -502,9 +771,9 @@ class EmbeddingService:
                 else:
                     logger.warning(f"No se pudo eliminar archivo: {chunks_file_path}")
                 
-                # También eliminar archivos temporales locales si existen
-                self.cleanup_temp_files()
-                
+                # No se limpia self.temp_dir: la instancia del servicio se comparte
+                # entre invocaciones y el pipeline de embeddings trabaja en memoria
+                # (chunks, embeddings y metadatos no pasan por disco)
                 return success
             else:
                 # Es una ruta local
@@ -551,13 +820,13 @@ class EmbeddingService:
             results = batch_job.download()
             embeddings = [result['embedding'] for result in results]
             
-            return np.array(embeddings)
+            return np.array(embeddings, dtype=np.float32)
             
         except Exception as e:
             logger.error(f"Error en Batch API: {str(e)}")
             # Fallback a método normal
             logger.info("Fallback a método normal de embeddings")
-            return self.generate_embeddings(texts, batch_size=16, use_batch_api=False)
+            return self.generate_embeddings(texts, use_batch_api=False)
     
     def _create_input_file(self, texts: List[str]) -> str:
         """
@@ -569,25 +838,17 @@ class EmbeddingService:
         Returns:
             str: ID del archivo creado
         """
-        # Crear archivo temporal con los textos
-        import tempfile
-        import json
-        
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.jsonl', delete=False) as f:
-            for text in texts:
-                json.dump({"input": text, "model": EMBEDDING_MODEL}, f)
-                f.write('\n')
+        # Armar el JSONL en memoria y subirlo directamente, sin pasar por un
+        # archivo temporal en /tmp (que en Cloud Functions consume RAM)
+        payload = '\n'.join(
+            json.dumps({"input": text, "model": EMBEDDING_MODEL}) for text in texts
+        ).encode('utf-8') + b'\n'
         
         # Subir archivo a OpenAI
-        with open(f.name, 'rb') as file:
-            file_upload = openai.files.create(
-                file=file,
-                purpose="batch"
-            )
-        
-        # Limpiar archivo temporal
-        import os
-        os.unlink(f.name)
+        file_upload = openai.files.create(
+            file=('embeddings_batch.jsonl', payload),
+            purpose="batch"
+        )
         
         return file_upload.id
 
@@ -4,11 +4,11 @@ Servicio para gestionar la interacción con Google Cloud Storage.
 import os
 import logging
 import tempfile
+import threading
 from pathlib import Path
 from typing import Dict, List, Any, Optional
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
-import pandas as pd
-import numpy as np
 
 import json
 
@@ -26,6 +26,94 @@ GCS_PROCESSED_PREFIX = 'processed/'    # DEPRECATED - Todo migrado a PostgreSQL
 # Configurar logger
 logger = logging.getLogger(__name__)
 
+# A partir de este tamaño los archivos se suben en partes paralelas
+# (multipart de la API XML); por debajo una sola petición es más rápida
+PARALLEL_UPLOAD_MIN_BYTES = 64 * 1024 * 1024
+PARALLEL_UPLOAD_CHUNK_BYTES = 32 * 1024 * 1024
+PARALLEL_UPLOAD_WORKERS = 8
+
+# Pool de conexiones HTTP del cliente de Storage: alcanza para las subidas y
+# descargas paralelas sin reabrir conexiones TCP+TLS en cada petición
+STORAGE_POOL_CONNECTIONS = 16
+STORAGE_POOL_MAXSIZE = 32
+
+# Clientes compartidos por instancia, uno por archivo de credenciales ('' =
+# ADC); se crean en el primer uso
+_storage_clients: Dict[str, storage.Client] = {}
+_storage_client_lock = threading.Lock()
+
+
+def _resolve_credentials_path(credentials_path: Optional[str]) -> str:
+    """
+    Obtiene el archivo de credenciales a usar ('' para usar ADC).
+    
+    Args:
+        credentials_path (Optional[str]): Ruta indicada (por defecto GCS_CREDENTIALS_PATH)
+        
+    Returns:
+        str: Ruta existente al archivo de credenciales o ''
+    """
+    credentials_path = credentials_path or GCS_CREDENTIALS_PATH
+    if credentials_path and os.path.exists(credentials_path):
+        return os.path.abspath(credentials_path)
+    return ''
+
+
+def create_storage_client(credentials_path: str = '') -> storage.Client:
+    """
+    Crea un cliente de Storage con un pool de conexiones ampliado.
+    
+    Args:
+        credentials_path (str): Archivo de cuenta de servicio ('' para usar ADC)
+        
+    Returns:
+        storage.Client: Cliente autenticado
+    """
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+    
+    if credentials_path:
+        # Credenciales explícitas: no dependen de GOOGLE_APPLICATION_CREDENTIALS
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(
+            credentials_path, scopes=storage.Client.SCOPE
+        )
+        project = credentials.project_id
+    else:
+        credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    session.mount("https://", HTTPAdapter(
+        pool_connections=STORAGE_POOL_CONNECTIONS,
+        pool_maxsize=STORAGE_POOL_MAXSIZE
+    ))
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+
+def get_storage_client(credentials_path: Optional[str] = None) -> storage.Client:
+    """
+    Obtiene el cliente de Storage compartido para unas credenciales.
+    
+    Se crea una sola vez por instancia y archivo de credenciales: las
+    invocaciones en caliente reutilizan las credenciales y las conexiones
+    abiertas, y servicios con credenciales distintas no comparten cliente.
+    
+    Args:
+        credentials_path (Optional[str]): Archivo de credenciales (por defecto
+            GCS_CREDENTIALS_PATH; si no existe se usa ADC)
+        
+    Returns:
+        storage.Client: Cliente compartido
+    """
+    key = _resolve_credentials_path(credentials_path)
+    client = _storage_clients.get(key)
+    if client is None:
+        with _storage_client_lock:
+            client = _storage_clients.get(key)
+            if client is None:
+                client = _storage_clients[key] = create_storage_client(key)
+    return client
+
 
 class GCSService:
     """
@@ -49,14 +137,13 @@ class GCSService:
         # Configurar credenciales (opcional para desarrollo local)
         # En producción (Cloud Functions/Cloud Run) usar la cuenta de servicio asignada
         if self.credentials_path and os.path.exists(self.credentials_path):
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = self.credentials_path
             logger.info(f"Credenciales configuradas desde archivo: {self.credentials_path}")
         else:
             logger.info("Usando credenciales por defecto (ADC - Application Default Credentials)")
         
         # Inicializar cliente de GCS
         try:
-            self.client = storage.Client()
+            self.client = get_storage_client(self.credentials_path)
             self.bucket = self.client.bucket(self.bucket_name)
             logger.info(f"Servicio GCS inicializado para el bucket: {self.bucket_name}")
         except Exception as e:
@@ -120,8 +207,20 @@ class GCSService:
             if content_type:
                 blob.content_type = content_type
             
-            with open(local_path, 'rb') as f:
-                blob.upload_from_file(f)
+            if os.path.getsize(local_path) >= PARALLEL_UPLOAD_MIN_BYTES:
+                # Las partes se suben en hilos y GCS las une al final
+                from google.cloud.storage import transfer_manager
+                transfer_manager.upload_chunks_concurrently(
+                    local_path,
+                    blob,
+                    content_type=content_type,
+                    chunk_size=PARALLEL_UPLOAD_CHUNK_BYTES,
+                    max_workers=PARALLEL_UPLOAD_WORKERS,
+                    worker_type=transfer_manager.THREAD
+                )
+            else:
+                with open(local_path, 'rb') as f:
+                    blob.upload_from_file(f)
                 
             logger.info(f"Archivo subido exitosamente: {local_path} -> gs://{self.bucket_name}/{gcs_path}")
             return True
@@ -273,13 +372,14 @@ class GCSService:
         try:
             blob = self.bucket.blob(gcs_path)
             
-            if not blob.exists():
-                raise FileNotFoundError(f"El archivo {gcs_path} no existe en el bucket {self.bucket_name}")
-            
+            # Descargar directamente: un archivo inexistente llega como
+            # NotFound, sin la petición extra de exists()
             content = blob.download_as_bytes()
             logger.info(f"Archivo leído como bytes: gs://{self.bucket_name}/{gcs_path}")
             return content
             
+        except NotFound:
+            raise FileNotFoundError(f"El archivo {gcs_path} no existe en el bucket {self.bucket_name}")
         except FileNotFoundError:
             raise  # Re-lanzar FileNotFoundError tal como está
         except Exception as e:
@@ -339,14 +439,13 @@ class GCSService:
             Dict[str, Any]: Diccionario con metadatos del archivo
         """
         try:
-            blob = self.bucket.blob(gcs_path)
+            # get_blob trae los metadatos en una sola petición (None si no
+            # existe), en lugar de exists() seguido de reload()
+            blob = self.bucket.get_blob(gcs_path)
             
-            if not blob.exists():
+            if blob is None:
                 raise FileNotFoundError(f"El archivo {gcs_path} no existe en el bucket {self.bucket_name}")
             
-            # Recargar para obtener metadatos actualizados
-            blob.reload()
-            
             metadata = {
                 'name': blob.name,
                 'size': blob.size,
@@ -361,27 +460,14 @@ class GCSService:
             logger.info(f"Metadatos obtenidos para: gs://{self.bucket_name}/{gcs_path}")
             return metadata
             
+        except FileNotFoundError:
+            raise  # Re-lanzar FileNotFoundError tal como está
         except Exception as e:
             logger.error(f"Error al obtener metadatos: {str(e)}")
             raise
 
 
     
-    def _cleanup_directory(self, directory: Path):
-        """
-        Limpia un directorio temporal.
-        
-        Args:
-            directory (Path): Directorio a limpiar
-        """
-        try:
-            if directory.exists():
-                import shutil
-                shutil.rmtree(directory)
-                logger.info(f"Directorio temporal limpiado: {directory}")
-        except Exception as e:
-            logger.error(f"Error al limpiar directorio temporal: {str(e)}")
-    
     def get_bucket_info(self) -> Dict[str, Any]:
         """
         Obtiene información del bucket.
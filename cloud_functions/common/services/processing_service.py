@@ -9,7 +9,6 @@ Este módulo proporciona funcionalidades para:
 
 Dependencias:
 - marker-pdf: Para conversión PDF a Markdown
-- pandas: Para manipulación de datos
 - tqdm: Para barras de progreso
 
 Configuración:
@@ -29,6 +28,12 @@ from common.config.settings import CHUNK_SIZE, CHUNK_OVERLAP, TEMP_DIR
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+# Hilos de OpenMP/PyTorch para Marker. Sin fijarlo se toma el número de
+# núcleos del host, no los asignados a la instancia, y los hilos compiten
+# entre sí por la caché; más de 4 no mejora la inferencia en CPU
+MARKER_NUM_THREADS = min(4, len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity')
+                         else os.cpu_count() or 1)
+
 
 class DocumentProcessor:
     """
@@ -49,6 +54,16 @@ class DocumentProcessor:
         >>> logger.info(f"Procesados {result['num_chunks']} chunks")
     """
     
+    # Patrones markdown compilados una sola vez para todas las instancias
+    TITLE_PATTERN = re.compile(r'^#\s+')  # Título principal
+    SECTION_PATTERN = re.compile(r'^##\s+')  # Secciones
+    ARTICLE_PATTERN = re.compile(r'^###\s+Art(?:ículo|\.)\s*(\d+\º?)\.?', re.IGNORECASE)  # Artículos
+    PAGE_BREAK_PATTERN = re.compile(r'^\d+\s*\n-{3,}$')  # Saltos de página
+    
+    # marker_single --help importa todo Marker (varios segundos): se verifica
+    # una sola vez por proceso, no en cada instancia
+    _marker_verified = False
+    
     def __init__(self, temp_dir: str = TEMP_DIR):
         """
         Inicializa el procesador de documentos.
@@ -60,7 +75,9 @@ class DocumentProcessor:
         self.temp_dir.mkdir(parents=True, exist_ok=True)
         
         # Verificar que marker esté instalado
-        self._verify_marker_installation()
+        if not DocumentProcessor._marker_verified:
+            self._verify_marker_installation()
+            DocumentProcessor._marker_verified = True
         
     def _verify_marker_installation(self) -> None:
         """
@@ -93,7 +110,8 @@ class DocumentProcessor:
             logger.error("Asegúrate de que marker-pdf esté instalado: pip install marker-pdf")
             raise RuntimeError("Marker no está instalado correctamente")
     
-    def process_pdf_to_markdown(self, pdf_path: str, output_dir: str = None) -> Dict[str, Any]:
+    def process_pdf_to_markdown(self, pdf_path: str, output_dir: str = None,
+                                work_dir: str = None) -> Dict[str, Any]:
         """
         Convierte un archivo PDF a formato Markdown usando la herramienta Marker.
         
@@ -106,7 +124,10 @@ class DocumentProcessor:
         Args:
             pdf_path (str): Ruta completa al archivo PDF a procesar
             output_dir (str, optional): Directorio donde guardar el resultado. 
-                                      Si es None, usa un directorio temporal.
+                                      Si es None, usa un directorio temporal
+                                      que se elimina al terminar.
+            work_dir (str, optional): Directorio donde crear ese temporal
+                                      (por defecto temp_dir del procesador).
                                       
         Returns:
             Dict[str, Any]: Diccionario con información del procesamiento que incluye:
@@ -133,20 +154,45 @@ class DocumentProcessor:
         if not pdf_path.exists():
             raise FileNotFoundError(f"No se encontró el archivo PDF: {pdf_path}")
         
-        # Usar directorio temporal si no se especifica uno
-        if output_dir is None:
-            output_dir = self.temp_dir / f"processing_{pdf_path.stem}"
-        else:
+        # Sin output_dir, la salida de Marker (markdown e imágenes) va a un
+        # directorio temporal que se elimina completo al terminar; antes quedaba
+        # en temp_dir y se acumulaba en /tmp entre invocaciones en caliente
+        if output_dir is not None:
             output_dir = Path(output_dir)
-            
-        try:
-            output_dir.mkdir(parents=True, exist_ok=True)
-        except (OSError, PermissionError) as e:
-            logger.warning(f"No se pudo crear directorio {output_dir}: {e}")
-            # En Cloud Functions usar /tmp
+            try:
+                output_dir.mkdir(parents=True, exist_ok=True)
+            except (OSError, PermissionError) as e:
+                logger.warning(f"No se pudo crear directorio {output_dir}: {e}")
+                output_dir = None
+        
+        if output_dir is None:
             import tempfile
-            output_dir = Path(tempfile.mkdtemp(prefix="marker_"))
+            with tempfile.TemporaryDirectory(prefix="marker_", dir=work_dir or self.temp_dir) as scratch_dir:
+                markdown_content = self._run_marker(pdf_path, Path(scratch_dir))
+        else:
+            markdown_content = self._run_marker(pdf_path, output_dir)
         
+        if not markdown_content:
+            raise RuntimeError(f"No se pudo extraer contenido markdown de {pdf_path}")
+        
+        return {
+            'filename': pdf_path.name,
+            'markdown_content': markdown_content,
+            'output_dir': str(output_dir) if output_dir else None,
+            'processed_successfully': True
+        }
+    
+    def _run_marker(self, pdf_path: Path, output_dir: Path) -> str:
+        """
+        Ejecuta marker_single sobre el PDF y lee el markdown generado.
+        
+        Args:
+            pdf_path (Path): Ruta al archivo PDF
+            output_dir (Path): Directorio de salida de Marker
+            
+        Returns:
+            str: Contenido markdown (vacío si no se encontró)
+        """
         logger.info(f"Procesando documento con Marker: {pdf_path}")
         
         # Preparar los argumentos para marker_single
@@ -156,18 +202,27 @@ class DocumentProcessor:
             "--output_dir", str(output_dir),
             "--output_format", "markdown",
             "--paginate_output",
-            "--force_ocr"
+            "--force_ocr",
+            # Solo se lee el markdown: las imágenes extraídas se escribían en
+            # /tmp (memoria en Cloud Functions) para descartarse sin usarse
+            "--disable_image_extraction"
         ]
         
         # Ejecutar marker_single
         try:
             logger.info(f"Ejecutando: {' '.join(marker_cmd)}")
+            # Respetar los valores que ya vengan configurados en el entorno
+            marker_env = dict(os.environ)
+            for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+                marker_env.setdefault(variable, str(MARKER_NUM_THREADS))
+            
             result = subprocess.run(
                 marker_cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                check=False
+                check=False,
+                env=marker_env
             )
             
             if result.returncode != 0:
@@ -181,17 +236,7 @@ class DocumentProcessor:
             raise
         
         # Procesar archivos resultantes
-        markdown_content = self._extract_markdown_content(output_dir, pdf_path.stem)
-        
-        if not markdown_content:
-            raise RuntimeError(f"No se pudo extraer contenido markdown de {pdf_path}")
-        
-        return {
-            'filename': pdf_path.name,
-            'markdown_content': markdown_content,
-            'output_dir': str(output_dir),
-            'processed_successfully': True
-        }
+        return self._extract_markdown_content(output_dir, pdf_path.stem)
     
     def _extract_markdown_content(self, output_dir: Path, filename_stem: str) -> str:
         """
@@ -252,10 +297,10 @@ class DocumentProcessor:
         lines = text.split('\n')
         
         # Detectar patrones markdown específicos
-        title_pattern = re.compile(r'^#\s+')  # Título principal
-        section_pattern = re.compile(r'^##\s+')  # Secciones
-        article_pattern = re.compile(r'^###\s+Art(?:ículo|\.)\s*(\d+\º?)\.?', re.IGNORECASE)  # Artículos
-        page_break_pattern = re.compile(r'^\d+\s*\n-{3,}$')  # Saltos de página
+        title_pattern = self.TITLE_PATTERN
+        section_pattern = self.SECTION_PATTERN
+        article_pattern = self.ARTICLE_PATTERN
+        page_break_pattern = self.PAGE_BREAK_PATTERN
         
         # Identificar las secciones principales y los artículos
         section_indices = []
@@ -419,9 +464,12 @@ class DocumentProcessor:
         if not chunks:
             return chunks
         
-        processed_chunks = []
-        title_pattern = re.compile(r'^#\s+')
-        section_pattern = re.compile(r'^##\s+')
+        # Cada chunk resultante se arma como lista de partes y se une una sola
+        # vez al final: concatenar sobre el anterior copiaba el texto acumulado
+        # en cada combinación (cuadrático con muchos chunks pequeños seguidos)
+        groups = []
+        title_pattern = self.TITLE_PATTERN
+        section_pattern = self.SECTION_PATTERN
         
         for i, chunk in enumerate(chunks):
             chunk_words = len(chunk.split())
@@ -429,30 +477,27 @@ class DocumentProcessor:
             if (chunk_words < min_chunk_size and i > 0 and 
                 not title_pattern.search(chunk) and not section_pattern.search(chunk)):
                 # Combinar con el chunk anterior
-                if processed_chunks:
-                    previous_chunk = processed_chunks[-1]
-                    combined_chunk = previous_chunk + "\n\n" + chunk
-                    processed_chunks[-1] = combined_chunk
-                else:
-                    processed_chunks.append(chunk)
+                groups[-1].append(chunk)
             else:
-                processed_chunks.append(chunk)
+                groups.append([chunk])
         
-        return processed_chunks
+        return ["\n\n".join(group) for group in groups]
     
-    def process_document_complete(self, pdf_path: str) -> Dict[str, Any]:
+    def process_document_complete(self, pdf_path: str, work_dir: str = None) -> Dict[str, Any]:
         """
         Procesa completamente un documento PDF: conversión a markdown y chunking.
         
         Args:
             pdf_path (str): Ruta al archivo PDF
+            work_dir (str, optional): Directorio temporal de la invocación para
+                                      la salida intermedia de Marker
             
         Returns:
             Dict[str, Any]: Diccionario con toda la información del documento procesado
         """
         try:
             # Procesar PDF a Markdown
-            markdown_result = self.process_pdf_to_markdown(pdf_path)
+            markdown_result = self.process_pdf_to_markdown(pdf_path, work_dir=work_dir)
             
             # Dividir en chunks
             chunks = self.split_into_chunks(
@@ -480,32 +525,10 @@ class DocumentProcessor:
                 'processed_successfully': False,
                 'error': str(e)
             }
-    
-    def cleanup_temp_files(self, output_dir: str = None):
-        """
-        Limpia archivos temporales.
-        
-        Args:
-            output_dir (str): Directorio específico a limpiar (opcional)
-        """
-        try:
-            if output_dir:
-                import shutil
-                shutil.rmtree(output_dir)
-                logger.info(f"Directorio temporal limpiado: {output_dir}")
-            else:
-                # Limpiar todo el directorio temporal
-                import shutil
-                if self.temp_dir.exists():
-                    shutil.rmtree(self.temp_dir)
-                    try:
-                        self.temp_dir.mkdir(parents=True, exist_ok=True)
-                    except (OSError, PermissionError):
-                        # Usar /tmp en Cloud Functions
-                        self.temp_dir = Path("/tmp")
-                    logger.info("Directorio temporal completamente limpiado")
-        except Exception as e:
-            logger.error(f"Error al limpiar archivos temporales: {str(e)}")
+
+
+# Procesador compartido por la función de conveniencia
+_default_processor = None
 
 
 # Función de conveniencia
@@ -519,5 +542,7 @@ def process_pdf_document(pdf_path: str) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: Diccionario con información del documento procesado
     """
-    processor = DocumentProcessor()
-    return processor.process_document_complete(pdf_path) 
\ No newline at end of file
+    global _default_processor
+    if _default_processor is None:
+        _default_processor = DocumentProcessor()
+    return _default_processor.process_document_complete(pdf_path) 
\ No newline at end of file
@@ -9,11 +9,28 @@ from typing import Dict, List, Optional, Any
 from enum import Enum
 from pathlib import Path
 
-from google.cloud import storage
+from google.api_core.exceptions import NotFound
 from common.config.settings import GCS_BUCKET_NAME
+from common.services.gcs_service import get_storage_client
 
 logger = logging.getLogger(__name__)
 
+# Los estados se parsean directamente desde los bytes descargados y se
+# serializan a bytes; orjson es opcional y json también acepta bytes
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+
+def _dump_status(status_data: Dict[str, Any]) -> bytes:
+    """Serializa un estado a JSON indentado (UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(status_data, option=orjson.OPT_INDENT_2)
+    return json.dumps(status_data, indent=2, ensure_ascii=False).encode('utf-8')
+
 
 class DocumentStatus(Enum):
     """Estados posibles de un documento en procesamiento."""
@@ -37,7 +54,7 @@ class StatusService:
             bucket_name (str): Nombre del bucket de GCS
         """
         self.bucket_name = bucket_name
-        self.client = storage.Client()
+        self.client = get_storage_client()
         self.bucket = self.client.bucket(self.bucket_name)
         self.status_prefix = "status/"
         
@@ -177,7 +194,11 @@ class StatusService:
             blobs = self.bucket.list_blobs(prefix=self.status_prefix)
             
             for blob in blobs:
-                if blob.name.endswith('.json') and len(documents) < limit:
+                # Cortar el listado al llegar al límite: las páginas restantes
+                # del prefijo no se piden a GCS
+                if len(documents) >= limit:
+                    break
+                if blob.name.endswith('.json'):
                     status_data = self._load_status_from_blob(blob)
                     if status_data:
                         documents.append(status_data)
@@ -190,6 +211,54 @@ class StatusService:
         
         return documents
     
+    def find_document_id_by_filename(self, filename: str) -> Optional[str]:
+        """
+        Busca el document_id más reciente de un archivo sin descargar estados.
+        
+        Los estados se guardan como status/{filename}_{timestamp}.json, por lo
+        que basta listar ese prefijo en GCS.
+        
+        Args:
+            filename (str): Nombre del archivo original
+            
+        Returns:
+            str: ID del documento o None si no se encuentra
+        """
+        try:
+            prefix = f"{self.status_prefix}{filename}_"
+            latest_timestamp = -1
+            document_id = None
+            
+            for blob in self.client.list_blobs(self.bucket_name, prefix=prefix):
+                if not blob.name.endswith('.json'):
+                    continue
+                # Descartar archivos cuyo nombre solo comparte el prefijo
+                timestamp = blob.name[len(prefix):-len('.json')]
+                if timestamp.isdigit() and int(timestamp) > latest_timestamp:
+                    latest_timestamp = int(timestamp)
+                    document_id = blob.name[len(self.status_prefix):-len('.json')]
+            
+            return document_id
+            
+        except Exception as e:
+            logger.error(f"Error buscando documento por nombre {filename}: {str(e)}")
+            return None
+    
+    def get_document_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el estado del documento más reciente de un archivo.
+        
+        Args:
+            filename (str): Nombre del archivo original
+            
+        Returns:
+            Dict: Estado del documento o None si no existe
+        """
+        document_id = self.find_document_id_by_filename(filename)
+        if not document_id:
+            return None
+        return self._load_status(document_id)
+    
     def delete_document_status(self, document_id: str) -> bool:
         """
         Elimina el estado de un documento.
@@ -216,7 +285,7 @@ class StatusService:
             blob_name = f"{self.status_prefix}{document_id}.json"
             blob = self.bucket.blob(blob_name)
             blob.upload_from_string(
-                json.dumps(status_data, indent=2, ensure_ascii=False),
+                _dump_status(status_data),
                 content_type='application/json'
             )
         except Exception as e:
@@ -229,11 +298,11 @@ class StatusService:
             blob_name = f"{self.status_prefix}{document_id}.json"
             blob = self.bucket.blob(blob_name)
             
-            if not blob.exists():
-                return None
-            
-            data = blob.download_as_text()
-            return json.loads(data)
+            # Descargar directamente: un estado inexistente llega como NotFound,
+            # sin la petición extra de exists()
+            return _json_loads(blob.download_as_bytes())
+        except NotFound:
+            return None
         except Exception as e:
             logger.error(f"Error cargando estado: {str(e)}")
             return None
@@ -241,12 +310,24 @@ class StatusService:
     def _load_status_from_blob(self, blob) -> Optional[Dict[str, Any]]:
         """Carga el estado desde un blob de GCS."""
         try:
-            data = blob.download_as_text()
-            return json.loads(data)
+            return _json_loads(blob.download_as_bytes())
         except Exception as e:
             logger.error(f"Error cargando estado desde blob: {str(e)}")
             return None
 
 
-# Instancia global del servicio
-status_service = StatusService() 
\ No newline at end of file
+# Instancia global del servicio (se crea en el primer uso, no al importar)
+_status_service = None
+
+
+def get_status_service() -> StatusService:
+    """
+    Obtiene la instancia global del servicio de estado.
+    
+    Returns:
+        StatusService: Instancia compartida del servicio
+    """
+    global _status_service
+    if _status_service is None:
+        _status_service = StatusService()
+    return _status_service
\ No newline at end of file
@@ -8,17 +8,196 @@ Este servicio reemplaza las funcionalidades de FAISS para:
 4. Proporcionar operaciones CRUD para vectores
 """
 import logging
-import numpy as np
-import pandas as pd
-from typing import List, Dict, Any, Optional
-from sqlalchemy import text, func
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator, TYPE_CHECKING
+from sqlalchemy import text, func, bindparam, delete, insert, select
 from datetime import datetime
+from pgvector.sqlalchemy import Vector
 
 from common.db.connection import get_engine, get_session
-from common.db.models import EmbeddingModel, create_tables, get_table_info
+from common.db.models import EmbeddingModel, DocumentModel, EmbeddingCacheModel, create_tables, get_table_info
+
+# numpy/pyarrow solo se usan en anotaciones: no se importan en el cold start
+if TYPE_CHECKING:
+    import numpy as np
+    import pyarrow as pa
 
 logger = logging.getLogger(__name__)
 
+# Sentencias de búsqueda construidas una sola vez. El tipo Vector en el
+# parámetro evita que SQLAlchemy tenga que inferirlo en cada ejecución y
+# permite reutilizar la sentencia compilada desde el caché del engine.
+_SIMILARITY_SEARCH_BY_DOCUMENT_SQL = text("""
+    SELECT 
+        text_content,
+        document_id,
+        chunk_id,
+        embedding_vector <=> :query_embedding as distance
+    FROM embeddings
+    WHERE document_id = :document_id
+    ORDER BY embedding_vector <=> :query_embedding
+    LIMIT :k
+""").bindparams(bindparam('query_embedding', type_=Vector(1536)))
+
+_SIMILARITY_SEARCH_SQL = text("""
+    SELECT 
+        text_content,
+        document_id,
+        chunk_id,
+        embedding_vector <=> :query_embedding as distance
+    FROM embeddings
+    ORDER BY embedding_vector <=> :query_embedding
+    LIMIT :k
+""").bindparams(bindparam('query_embedding', type_=Vector(1536)))
+
+
+# Por debajo de este número de filas por partición el escaneo secuencial es
+# exacto y más rápido que un índice aproximado
+IVFFLAT_MIN_ROWS = 10000
+
+# HNSW (pgvector >= 0.5.0) no necesita entrenamiento ni redimensionarse al
+# crecer el corpus; se prefiere a IVFFlat cuando la extensión lo soporta
+HNSW_MIN_VERSION = (0, 5, 0)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+# Valor por defecto de hnsw.ef_search: limita cuántos resultados devuelve
+HNSW_EF_SEARCH_DEFAULT = 40
+# Máximo que pgvector acepta para hnsw.ef_search
+HNSW_EF_SEARCH_MAX = 1000
+
+_VECTOR_INDEX_DEF_SQL = text("""
+    SELECT indexdef
+    FROM pg_indexes
+    WHERE tablename = 'embeddings' AND indexname = 'idx_embeddings_vector_cosine'
+""")
+
+_VECTOR_EXTENSION_VERSION_SQL = text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+
+# Particiones reales de embeddings: una tabla creada antes del particionado
+# (ver create_embedding_partitions) es una sola tabla regular
+_EMBEDDINGS_PARTITION_COUNT_SQL = text("""
+    SELECT CASE WHEN c.relkind = 'p'
+                THEN (SELECT count(*) FROM pg_inherits i WHERE i.inhparent = c.oid)
+                ELSE 1 END
+    FROM pg_class c
+    WHERE c.relname = 'embeddings'
+""")
+
+_INDEX_LISTS_RE = re.compile(r"lists\s*=\s*'?(\d+)")
+
+
+# Hashes por consulta o inserción en el caché de embeddings
+EMBEDDING_CACHE_BATCH_SIZE = 500
+
+
+def _rows_per_partition(num_rows: int, partitions: int) -> int:
+    """
+    Estima las filas de cada partición de embeddings (particionado HASH uniforme).
+    
+    Args:
+        num_rows (int): Número total de embeddings
+        partitions (int): Particiones de la tabla (1 si no está particionada)
+        
+    Returns:
+        int: Filas aproximadas por partición
+    """
+    return num_rows // max(1, partitions)
+
+
+def _ivfflat_lists(num_rows: int, partitions: int) -> int:
+    """
+    Calcula el número de listas (clusters) del índice IVFFlat.
+    
+    El índice sobre la tabla padre se crea en cada partición, y cada una
+    entrena sus listas solo con sus propias filas: se dimensiona por
+    partición, no por el total.
+    
+    Args:
+        num_rows (int): Número total de embeddings indexados
+        partitions (int): Particiones de la tabla (1 si no está particionada)
+        
+    Returns:
+        int: Número de listas por partición, aproximadamente 4 * sqrt(N / particiones)
+    """
+    return max(1, int(4 * math.sqrt(_rows_per_partition(num_rows, partitions))))
+
+
+def _index_method(indexdef: Optional[str]) -> str:
+    """
+    Obtiene el método del índice vectorial a partir de su definición.
+    
+    Args:
+        indexdef (Optional[str]): Definición del índice (pg_indexes.indexdef)
+        
+    Returns:
+        str: 'hnsw', 'ivfflat' o '' si no hay índice
+    """
+    if not indexdef:
+        return ''
+    return 'hnsw' if 'USING hnsw' in indexdef else 'ivfflat'
+
+
+def _index_lists(indexdef: Optional[str]) -> Optional[int]:
+    """
+    Obtiene el número de listas de un índice IVFFlat a partir de su definición.
+    
+    Args:
+        indexdef (Optional[str]): Definición del índice (pg_indexes.indexdef)
+        
+    Returns:
+        Optional[int]: Número de listas, o None si no es un índice IVFFlat
+    """
+    match = _INDEX_LISTS_RE.search(indexdef) if _index_method(indexdef) == 'ivfflat' else None
+    return int(match.group(1)) if match else None
+
+
+def _supports_hnsw(extversion: Optional[str]) -> bool:
+    """
+    Indica si la versión instalada de pgvector soporta índices HNSW.
+    
+    Args:
+        extversion (Optional[str]): Versión de la extensión (p.ej. '0.5.1')
+        
+    Returns:
+        bool: True si la versión es >= HNSW_MIN_VERSION
+    """
+    try:
+        return tuple(int(part) for part in extversion.split('.')[:3]) >= HNSW_MIN_VERSION
+    except (AttributeError, ValueError):
+        return False
+
+
+def _ivfflat_probes(lists: int) -> int:
+    """
+    Calcula cuántas listas revisar por consulta (sqrt(lists)).
+    
+    Args:
+        lists (int): Número de listas del índice
+        
+    Returns:
+        int: Número de listas a revisar
+    """
+    return max(1, int(round(math.sqrt(lists))))
+
+
+def _column_sum(table: "pa.Table", column: str) -> int:
+    """
+    Suma una columna numérica de una tabla de Arrow (0 si no existe).
+
+    Args:
+        table (pa.Table): Tabla de Arrow
+        column (str): Nombre de la columna
+
+    Returns:
+        int: Suma de la columna
+    """
+    if column not in table.column_names:
+        return 0
+    import pyarrow.compute as pc
+    return int(pc.sum(table.column(column)).as_py() or 0)
+
 
 class VectorDBService:
     """
@@ -28,9 +207,27 @@ class VectorDBService:
     def __init__(self):
         """Inicializa el servicio de base de datos vectorial."""
         self.engine = get_engine()
+        self._gcs = None
+        # Método del índice vectorial ('hnsw', 'ivfflat' o '') y probes de
+        # IVFFlat; None hasta leerlos de la base
+        self._index_method = None
+        self._ivfflat_probes = None
         self._ensure_tables_exist()
         logger.info("VectorDBService inicializado")
     
+    @property
+    def gcs_service(self):
+        """
+        Servicio de GCS reutilizado entre llamadas (se crea en el primer uso).
+        
+        Returns:
+            GCSService: Instancia compartida del servicio de GCS
+        """
+        if self._gcs is None:
+            from common.services.gcs_service import GCSService
+            self._gcs = GCSService()
+        return self._gcs
+    
     def _ensure_tables_exist(self):
         """Asegura que las tablas necesarias existan."""
         try:
@@ -40,129 +237,175 @@ class VectorDBService:
             logger.error(f"Error al verificar/crear tablas: {str(e)}")
             raise
     
-    def store_embeddings(self, embeddings: np.ndarray, metadata_df: pd.DataFrame) -> bool:
+    def store_embeddings(self, embeddings: "np.ndarray", metadata: "pa.Table") -> bool:
         """
         Almacena embeddings en la base de datos.
         
         Args:
             embeddings (np.ndarray): Array de embeddings
-            metadata_df (pd.DataFrame): DataFrame con metadatos
+            metadata (pa.Table): Tabla de Arrow con metadatos
             
         Returns:
             bool: True si se almacenaron exitosamente
         """
         try:
-            if len(embeddings) != len(metadata_df):
+            if len(embeddings) != metadata.num_rows:
                 raise ValueError("El número de embeddings no coincide con el número de registros de metadatos")
             
-            # Convertir embeddings a lista para pgvector
-            embedding_list = embeddings.tolist()
+            # Sin registros no hay nada que reemplazar: se evita abrir sesión,
+            # consultar GCS y convertir los embeddings
+            num_records = metadata.num_rows
+            if num_records == 0:
+                logger.warning("No hay embeddings para almacenar")
+                return True
             
-            # Preparar datos para inserción
-            records = []
-            for i, (_, row) in enumerate(metadata_df.iterrows()):
-                record = {
-                    'document_id': row.get('document_id', 'unknown'),
-                    'chunk_id': row.get('chunk_id', f'chunk_{i}'),
-                    'text_content': row.get('text', ''),
-                    'embedding_vector': embedding_list[i]
-                }
-                records.append(record)
+            # Marca temporal única para toda la operación
+            now = datetime.now()
+            
+            # Un único bloque float32 contiguo (sin copia si ya lo es). La
+            # conversión a listas para pgvector se hace por lote más abajo: la
+            # matriz completa como floats de Python ocupa ~6 veces más
+            import numpy as np
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            
+            # Preparar columnas para inserción (struct-of-arrays: una lista por
+            # columna en lugar de un dict por fila)
+            columns = set(metadata.column_names)
+            document_ids = (metadata.column('document_id').to_pylist() if 'document_id' in columns
+                            else ['unknown'] * num_records)
+            chunk_ids = (metadata.column('chunk_id').to_pylist() if 'chunk_id' in columns
+                         else [f'chunk_{i}' for i in range(num_records)])
+            texts = metadata.column('text').to_pylist() if 'text' in columns else [''] * num_records
             
             # Insertar en lotes para mejor rendimiento
             batch_size = 100
-            with get_session() as session:
-                # Primero, guardar información del documento en la tabla documents
-                if records:
-                    first_record = records[0]
-                    filename = metadata_df.iloc[0].get('filename', 'unknown')
-                    
-                    # Obtener información del archivo original desde uploads/
-                    file_size = 0
-                    upload_date = datetime.now()
-                    
-                    try:
-                        from common.services.gcs_service import GCSService
-                        gcs_service = GCSService()
-                        
-                        # Construir ruta del archivo original
-                        original_file_path = f"uploads/{filename}"
-                        
-                        if gcs_service.file_exists(original_file_path):
-                            # Obtener metadatos del archivo original
-                            file_metadata = gcs_service.get_file_metadata(original_file_path)
-                            file_size = file_metadata.get('size', 0)
-                            
-                            # Obtener fecha de creación del archivo
-                            created_str = file_metadata.get('created')
-                            if created_str:
-                                upload_date = datetime.fromisoformat(created_str.replace('Z', '+00:00'))
-                            
-                            logger.info(f"Metadatos del archivo original obtenidos: {filename}, size: {file_size}, created: {upload_date}")
-                        else:
-                            logger.warning(f"Archivo original no encontrado: {original_file_path}")
-                            
-                    except Exception as e:
-                        logger.warning(f"No se pudieron obtener metadatos del archivo original: {str(e)}")
-                    
-                    document_info = {
-                        'document_id': first_record['document_id'],
-                        'filename': filename,
-                        'file_size': file_size,
-                        'upload_date': upload_date,
-                        'processing_status': 'completed',
-                        'num_chunks': len(records),
-                        # Columnas individuales para metadatos del documento
-                        'chunk_count': len(records),
-                        'total_chars': sum(metadata_df.get('text_length', [0])),
-                        'total_words': sum(metadata_df.get('word_count', [0])),
-                        'processed_at': datetime.now(),
-                        'embedding_model': 'OpenAI text-embedding-3-small',
-                        'vector_dimension': 1536,
-                        'original_filename': filename
-                    }
-                    
-                    # Usar upsert para evitar duplicados
-                    from sqlalchemy.dialects.postgresql import insert
-                    from common.db.models import DocumentModel
-                    
-                    stmt = insert(DocumentModel).values(**document_info)
-                    stmt = stmt.on_conflict_do_update(
-                        index_elements=['document_id'],
-                        set_={
-                            'filename': document_info['filename'],
-                            'file_size': document_info['file_size'],
-                            'upload_date': document_info['upload_date'],
-                            'processing_status': document_info['processing_status'],
-                            'num_chunks': document_info['num_chunks'],
-                            'chunk_count': document_info['chunk_count'],
-                            'total_chars': document_info['total_chars'],
-                            'total_words': document_info['total_words'],
-                            'processed_at': document_info['processed_at'],
-                            'embedding_model': document_info['embedding_model'],
-                            'vector_dimension': document_info['vector_dimension'],
-                            'original_filename': document_info['original_filename'],
-                            'updated_at': datetime.now()
+            filename = metadata.column('filename')[0].as_py() if 'filename' in columns else 'unknown'
+            
+            with get_session() as session, ThreadPoolExecutor(max_workers=1) as executor:
+                # Los metadatos del archivo original se consultan en GCS en
+                # paralelo mientras se envían los embeddings a la base de datos
+                file_info_future = executor.submit(self._get_original_file_info, filename, now)
+                
+                # Reemplazar los chunks previos de los documentos en la misma
+                # transacción: el DELETE filtra por document_id (clave de
+                # partición), así que solo toca la partición del documento
+                session.execute(
+                    delete(EmbeddingModel).where(EmbeddingModel.document_id.in_(set(document_ids)))
+                )
+                
+                # Insertar embeddings con un INSERT multi-VALUES por lote sobre la
+                # tabla: los ids los asigna la base y nadie los lee de vuelta,
+                # así que no se crean objetos ORM ni se recuperan con RETURNING
+                embeddings_table = EmbeddingModel.__table__
+                for start in range(0, num_records, batch_size):
+                    end = start + batch_size
+                    batch_vectors = embeddings[start:end].tolist()
+                    session.execute(insert(embeddings_table).values([
+                        {
+                            'document_id': document_id,
+                            'chunk_id': chunk_id,
+                            'text_content': text_content,
+                            'embedding_vector': vector
                         }
-                    )
-                    session.execute(stmt)
+                        for document_id, chunk_id, text_content, vector in zip(
+                            document_ids[start:end], chunk_ids[start:end],
+                            texts[start:end], batch_vectors
+                        )
+                    ]))
+                
+                # Guardar información del documento en la tabla documents
+                file_size, upload_date = file_info_future.result()
                 
-                # Luego, insertar embeddings
-                for i in range(0, len(records), batch_size):
-                    batch = records[i:i + batch_size]
-                    embedding_models = [EmbeddingModel(**record) for record in batch]
-                    session.add_all(embedding_models)
+                document_info = {
+                    'document_id': document_ids[0],
+                    'filename': filename,
+                    'file_size': file_size,
+                    'upload_date': upload_date,
+                    'processing_status': 'completed',
+                    'num_chunks': num_records,
+                    # Columnas individuales para metadatos del documento
+                    'chunk_count': num_records,
+                    'total_chars': _column_sum(metadata, 'text_length'),
+                    'total_words': _column_sum(metadata, 'word_count'),
+                    'processed_at': now,
+                    'embedding_model': 'OpenAI text-embedding-3-small',
+                    'vector_dimension': 1536,
+                    'original_filename': filename
+                }
+                
+                # Usar upsert para evitar duplicados
+                from sqlalchemy.dialects.postgresql import insert as pg_insert
+                
+                stmt = pg_insert(DocumentModel).values(**document_info)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['document_id'],
+                    set_={
+                        'filename': document_info['filename'],
+                        'file_size': document_info['file_size'],
+                        'upload_date': document_info['upload_date'],
+                        'processing_status': document_info['processing_status'],
+                        'num_chunks': document_info['num_chunks'],
+                        'chunk_count': document_info['chunk_count'],
+                        'total_chars': document_info['total_chars'],
+                        'total_words': document_info['total_words'],
+                        'processed_at': document_info['processed_at'],
+                        'embedding_model': document_info['embedding_model'],
+                        'vector_dimension': document_info['vector_dimension'],
+                        'original_filename': document_info['original_filename'],
+                        'updated_at': now
+                    }
+                )
+                session.execute(stmt)
                 
                 session.commit()
             
-            logger.info(f"Almacenados {len(records)} embeddings y información del documento en la base de datos")
+            logger.info(f"Almacenados {num_records} embeddings y información del documento en la base de datos")
             return True
             
         except Exception as e:
             logger.error(f"Error al almacenar embeddings: {str(e)}")
             return False
     
-    def similarity_search(self, query_embedding: np.ndarray, k: int = 5, 
+    def _get_original_file_info(self, filename: str, default_date: datetime) -> tuple:
+        """
+        Obtiene tamaño y fecha de creación del archivo original en uploads/.
+        
+        Args:
+            filename (str): Nombre del archivo original
+            default_date (datetime): Fecha a usar si no hay metadatos
+            
+        Returns:
+            tuple: (tamaño en bytes, fecha de subida)
+        """
+        file_size = 0
+        upload_date = default_date
+        
+        try:
+            gcs_service = self.gcs_service
+            
+            # Construir ruta del archivo original
+            original_file_path = f"uploads/{filename}"
+            
+            # Una sola petición: get_file_metadata informa la ausencia con
+            # FileNotFoundError, sin un file_exists previo
+            file_metadata = gcs_service.get_file_metadata(original_file_path)
+            file_size = file_metadata.get('size', 0)
+            
+            # Obtener fecha de creación del archivo
+            created_str = file_metadata.get('created')
+            if created_str:
+                upload_date = datetime.fromisoformat(created_str.replace('Z', '+00:00'))
+            
+            logger.info(f"Metadatos del archivo original obtenidos: {filename}, size: {file_size}, created: {upload_date}")
+                
+        except FileNotFoundError:
+            logger.warning(f"Archivo original no encontrado: {original_file_path}")
+        except Exception as e:
+            logger.warning(f"No se pudieron obtener metadatos del archivo original: {str(e)}")
+        
+        return file_size, upload_date
+    
+    def similarity_search(self, query_embedding: "np.ndarray", k: int = 5, 
                          document_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Realiza búsqueda de similitud vectorial.
@@ -175,65 +418,99 @@ class VectorDBService:
         Returns:
             List[Dict[str, Any]]: Lista de resultados con similitud
         """
+        results = list(self.iter_similarity_search(query_embedding, k, document_id))
+        logger.info(f"Búsqueda de similitud completada: {len(results)} resultados")
+        return results
+    
+    def iter_similarity_search(self, query_embedding: "np.ndarray", k: int = 5,
+                               document_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Realiza búsqueda de similitud vectorial entregando los resultados a medida
+        que llegan desde la base de datos (cursor del lado del servidor).
+        
+        Args:
+            query_embedding (np.ndarray): Embedding de la consulta
+            k (int): Número de resultados a retornar
+            document_id (Optional[str]): Filtrar por documento específico
+            
+        Yields:
+            Dict[str, Any]: Resultado con similitud
+        """
         try:
             # Convertir embedding a lista para pgvector
             embedding_list = query_embedding.tolist()
             
-            # Construir query SQL
+            # Reutilizar las sentencias compiladas a nivel de módulo
             if document_id:
-                sql = text("""
-                    SELECT 
-                        text_content,
-                        document_id,
-                        chunk_id,
-                        embedding_vector <-> :query_embedding as distance
-                    FROM embeddings
-                    WHERE document_id = :document_id
-                    ORDER BY embedding_vector <-> :query_embedding
-                    LIMIT :k
-                """)
+                sql = _SIMILARITY_SEARCH_BY_DOCUMENT_SQL
                 params = {
                     "query_embedding": embedding_list,
                     "document_id": document_id,
                     "k": k
                 }
             else:
-                sql = text("""
-                    SELECT 
-                        text_content,
-                        document_id,
-                        chunk_id,
-                        embedding_vector <-> :query_embedding as distance
-                    FROM embeddings
-                    ORDER BY embedding_vector <-> :query_embedding
-                    LIMIT :k
-                """)
+                sql = _SIMILARITY_SEARCH_SQL
                 params = {
                     "query_embedding": embedding_list,
                     "k": k
                 }
             
+            search_settings = self._get_search_settings(k)
+            
             with self.engine.connect() as conn:
-                result = conn.execute(sql, params)
-                rows = result.fetchall()
+                for name, value in search_settings:
+                    # Solo aplica a la transacción de esta búsqueda
+                    conn.execute(text("SELECT set_config(:name, :value, true)"),
+                                 {"name": name, "value": str(value)})
+                result = conn.execution_options(stream_results=True, yield_per=64).execute(sql, params)
                 
-                # Convertir a lista de diccionarios
-                results = []
-                for row in rows:
-                    result_dict = {
-                        'text_content': row.text_content,
-                        'document_id': row.document_id,
-                        'chunk_id': row.chunk_id,
-                        'distance': float(row.distance)
+                for row in result.mappings():
+                    yield {
+                        'text_content': row['text_content'],
+                        'document_id': row['document_id'],
+                        'chunk_id': row['chunk_id'],
+                        'distance': float(row['distance'])
                     }
-                    results.append(result_dict)
-                
-                logger.info(f"Búsqueda de similitud completada: {len(results)} resultados")
-                return results
                 
         except Exception as e:
             logger.error(f"Error en búsqueda de similitud: {str(e)}")
-            return []
+    
+    def _get_search_settings(self, k: int) -> List[tuple]:
+        """
+        Obtiene los parámetros de búsqueda según el índice vectorial existente.
+        
+        Args:
+            k (int): Número de resultados pedidos
+            
+        Returns:
+            List[tuple]: Pares (parámetro, valor) a fijar en la transacción
+        """
+        if self._index_method is None:
+            try:
+                with self.engine.connect() as conn:
+                    self._set_index_config(conn.execute(_VECTOR_INDEX_DEF_SQL).scalar())
+            except Exception as e:
+                logger.warning(f"No se pudo leer la configuración del índice vectorial: {str(e)}")
+                return []
+        
+        if self._index_method == 'ivfflat' and self._ivfflat_probes:
+            return [('ivfflat.probes', self._ivfflat_probes)]
+        if self._index_method == 'hnsw' and k > HNSW_EF_SEARCH_DEFAULT:
+            # HNSW no devuelve más de ef_search candidatos (pgvector rechaza
+            # valores mayores a HNSW_EF_SEARCH_MAX)
+            return [('hnsw.ef_search', min(k, HNSW_EF_SEARCH_MAX))]
+        return []
+    
+    def _set_index_config(self, indexdef: Optional[str]):
+        """
+        Guarda el método y los probes del índice vectorial a partir de su definición.
+        
+        Args:
+            indexdef (Optional[str]): Definición del índice (pg_indexes.indexdef)
+        """
+        self._index_method = _index_method(indexdef)
+        lists = _index_lists(indexdef)
+        self._ivfflat_probes = _ivfflat_probes(lists) if lists else 0
     
     def get_document_embeddings(self, document_id: str) -> List[Dict[str, Any]]:
         """
@@ -247,7 +524,15 @@ class VectorDBService:
         """
         try:
             with get_session() as session:
-                embeddings = session.query(EmbeddingModel).filter(
+                # Solo las columnas que se devuelven: cargar la entidad completa
+                # traía y parseaba cada vector (1536 floats) para descartarlo
+                embeddings = session.query(
+                    EmbeddingModel.id,
+                    EmbeddingModel.document_id,
+                    EmbeddingModel.chunk_id,
+                    EmbeddingModel.text_content,
+                    EmbeddingModel.created_at
+                ).filter(
                     EmbeddingModel.document_id == document_id
                 ).all()
                 
@@ -269,6 +554,102 @@ class VectorDBService:
             logger.error(f"Error al obtener embeddings del documento: {str(e)}")
             return []
     
+    def get_stored_embeddings(self, document_id: str, texts: List[str]) -> Dict[str, "np.ndarray"]:
+        """
+        Obtiene los embeddings ya almacenados de un documento para ciertos textos.
+        
+        Args:
+            document_id (str): ID del documento
+            texts (List[str]): Textos de los chunks buscados
+            
+        Returns:
+            Dict[str, np.ndarray]: Embedding almacenado por texto (vacío si no hay)
+        """
+        try:
+            wanted = set(texts)
+            with get_session() as session:
+                # Filtrar por document_id solo toca la partición del documento
+                rows = session.query(
+                    EmbeddingModel.text_content,
+                    EmbeddingModel.embedding_vector
+                ).filter(
+                    EmbeddingModel.document_id == document_id
+                )
+                
+                return {
+                    row.text_content: row.embedding_vector
+                    for row in rows
+                    if row.text_content in wanted
+                }
+                
+        except Exception as e:
+            logger.warning(f"No se pudieron obtener embeddings almacenados de {document_id}: {str(e)}")
+            return {}
+    
+    def get_cached_embeddings(self, hashes: List[bytes], model: str) -> Dict[bytes, "np.ndarray"]:
+        """
+        Busca embeddings en el caché por contenido.
+        
+        Args:
+            hashes (List[bytes]): Hashes de contenido buscados
+            model (str): Modelo de embeddings
+            
+        Returns:
+            Dict[bytes, np.ndarray]: Embedding por hash encontrado (vacío si no hay)
+        """
+        try:
+            found = {}
+            with get_session() as session:
+                # Por lotes para no superar el límite de parámetros por sentencia
+                for start in range(0, len(hashes), EMBEDDING_CACHE_BATCH_SIZE):
+                    rows = session.execute(
+                        select(EmbeddingCacheModel.content_hash, EmbeddingCacheModel.embedding_vector)
+                        .where(EmbeddingCacheModel.model == model)
+                        .where(EmbeddingCacheModel.content_hash.in_(
+                            hashes[start:start + EMBEDDING_CACHE_BATCH_SIZE]
+                        ))
+                    )
+                    found.update((bytes(content_hash), vector) for content_hash, vector in rows)
+            return found
+            
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el caché de embeddings: {str(e)}")
+            return {}
+    
+    def cache_embeddings(self, hashes: List[bytes], model: str, embeddings: "np.ndarray") -> bool:
+        """
+        Agrega embeddings nuevos al caché por contenido.
+        
+        Args:
+            hashes (List[bytes]): Hash de contenido de cada embedding
+            model (str): Modelo de embeddings
+            embeddings (np.ndarray): Embeddings en el orden de hashes
+            
+        Returns:
+            bool: True si se guardaron exitosamente
+        """
+        if not hashes:
+            return True
+        
+        try:
+            from sqlalchemy.dialects.postgresql import insert as pg_insert
+            
+            with get_session() as session:
+                for start in range(0, len(hashes), EMBEDDING_CACHE_BATCH_SIZE):
+                    end = start + EMBEDDING_CACHE_BATCH_SIZE
+                    stmt = pg_insert(EmbeddingCacheModel.__table__).values([
+                        {'content_hash': content_hash, 'model': model, 'embedding_vector': vector}
+                        for content_hash, vector in zip(hashes[start:end], embeddings[start:end].tolist())
+                    ])
+                    # Otro documento pudo guardar el mismo texto en paralelo
+                    session.execute(stmt.on_conflict_do_nothing(index_elements=['content_hash']))
+                session.commit()
+            return True
+            
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el caché de embeddings: {str(e)}")
+            return False
+    
     def delete_document_embeddings(self, document_id: str) -> bool:
         """
         Elimina todos los embeddings de un documento específico.
@@ -281,9 +662,15 @@ class VectorDBService:
         """
         try:
             with get_session() as session:
-                deleted_count = session.query(EmbeddingModel).filter(
-                    EmbeddingModel.document_id == document_id
-                ).delete()
+                # DELETE directo por document_id (clave de partición): solo
+                # toca la partición del documento y no sincroniza la sesión ORM
+                deleted_count = session.execute(
+                    delete(EmbeddingModel).where(EmbeddingModel.document_id == document_id)
+                ).rowcount
+                
+                # La fila en documents mantiene los totales (ver
+                # get_embedding_totals): se elimina junto con sus embeddings
+                session.execute(delete(DocumentModel).where(DocumentModel.document_id == document_id))
                 
                 session.commit()
                 logger.info(f"Eliminados {deleted_count} embeddings del documento {document_id}")
@@ -293,6 +680,34 @@ class VectorDBService:
             logger.error(f"Error al eliminar embeddings del documento: {str(e)}")
             return False
     
+    def get_embedding_totals(self) -> Dict[str, int]:
+        """
+        Obtiene solo los totales de embeddings y documentos en una consulta.
+        
+        Es la versión liviana de get_database_stats para el final de cada
+        evento. Se calcula sobre la tabla documents (una fila por documento,
+        con num_chunks mantenido por store_embeddings), así que el costo por
+        evento no crece con el número total de embeddings.
+        
+        Returns:
+            Dict[str, int]: total_embeddings y unique_documents
+        """
+        try:
+            with get_session() as session:
+                total_embeddings, unique_documents = session.query(
+                    func.coalesce(func.sum(DocumentModel.num_chunks), 0),
+                    func.count(DocumentModel.id)
+                ).one()
+            
+            return {
+                'total_embeddings': int(total_embeddings),
+                'unique_documents': unique_documents
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al obtener totales de embeddings: {str(e)}")
+            return {}
+    
     def get_database_stats(self) -> Dict[str, Any]:
         """
         Obtiene estadísticas de la base de datos.
@@ -349,12 +764,51 @@ class VectorDBService:
         """
         try:
             with self.engine.connect() as conn:
-                # Índice para búsquedas de similitud (coseno)
-                conn.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_embeddings_vector_cosine 
-                    ON embeddings USING ivfflat (embedding_vector vector_cosine_ops) 
-                    WITH (lists = 100);
-                """))
+                # Los índices sobre la tabla padre se crean en cada partición
+                # Índice para búsquedas de similitud (coseno), dimensionado
+                # según los embeddings de cada partición
+                num_rows = conn.execute(text("SELECT count(*) FROM embeddings")).scalar() or 0
+                partitions = conn.execute(_EMBEDDINGS_PARTITION_COUNT_SQL).scalar() or 1
+                rows_per_partition = _rows_per_partition(num_rows, partitions)
+                indexdef = conn.execute(_VECTOR_INDEX_DEF_SQL).scalar()
+                use_hnsw = _supports_hnsw(conn.execute(_VECTOR_EXTENSION_VERSION_SQL).scalar())
+                
+                if rows_per_partition < IVFFLAT_MIN_ROWS:
+                    logger.info(
+                        f"{num_rows} embeddings (~{rows_per_partition} por partición): "
+                        f"se omite el índice vectorial (escaneo exacto)"
+                    )
+                elif use_hnsw:
+                    # HNSW: búsqueda sublineal sin listas que redimensionar;
+                    # reemplaza un IVFFlat previo
+                    if _index_method(indexdef) != 'hnsw':
+                        conn.execute(text("DROP INDEX IF EXISTS idx_embeddings_vector_cosine"))
+                        conn.execute(text(f"""
+                            CREATE INDEX IF NOT EXISTS idx_embeddings_vector_cosine 
+                            ON embeddings USING hnsw (embedding_vector vector_cosine_ops) 
+                            WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
+                        """))
+                        indexdef = conn.execute(_VECTOR_INDEX_DEF_SQL).scalar()
+                        logger.info(f"Índice HNSW creado para {num_rows} embeddings")
+                else:
+                    lists = _ivfflat_lists(num_rows, partitions)
+                    current_lists = _index_lists(indexdef)
+                    # Reconstruir solo si el corpus cambió de escala
+                    if current_lists and not (current_lists / 2 <= lists <= current_lists * 2):
+                        conn.execute(text("DROP INDEX IF EXISTS idx_embeddings_vector_cosine"))
+                        current_lists = None
+                    if not current_lists:
+                        conn.execute(text(f"""
+                            CREATE INDEX IF NOT EXISTS idx_embeddings_vector_cosine 
+                            ON embeddings USING ivfflat (embedding_vector vector_cosine_ops) 
+                            WITH (lists = {lists});
+                        """))
+                        indexdef = conn.execute(_VECTOR_INDEX_DEF_SQL).scalar()
+                        logger.info(
+                            f"Índice IVFFlat creado con {lists} listas por partición para {num_rows} embeddings"
+                        )
+                
+                self._set_index_config(indexdef)
                 
                 # Índices adicionales para consultas por documento
                 conn.execute(text("""
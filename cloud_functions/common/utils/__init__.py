@@ -7,12 +7,15 @@ from .resource_managers import (
     openai_client_context,
     processing_session_context,
     document_processing_context,
-    with_processing_resources
+    with_processing_resources,
+    ProcessingCancelledError,
+    raise_if_cancelled
 )
 
 __all__ = [
     'TempFileManager', 'temp_file', 'temp_dir',
     'gcs_client_context', 'openai_client_context',
     'processing_session_context', 'document_processing_context',
-    'with_processing_resources'
+    'with_processing_resources',
+    'ProcessingCancelledError', 'raise_if_cancelled'
 ] 
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Handlers de logging para archivos locales del sistema DrCecim Upload.
+
+Se usan en desarrollo, donde los logs también se escriben a disco.
+"""
+import os
+import logging
+import threading
+import time
+from typing import List
+
+# Límite de buffers por llamada a writev (IOV_MAX)
+_IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+
+class BatchedFileHandler(logging.Handler):
+    """
+    Handler que acumula los registros formateados en memoria y los escribe
+    al archivo en lote con os.writev.
+
+    Se vacía al superar flush_bytes o cuando el registro más antiguo
+    pendiente supera flush_interval segundos.
+    """
+
+    def __init__(self, filename: str, flush_bytes: int = 64 * 1024,
+                 flush_interval: float = 0.2, encoding: str = 'utf-8'):
+        """
+        Inicializa el handler.
+
+        Args:
+            filename (str): Ruta del archivo de log
+            flush_bytes (int): Tamaño acumulado que fuerza la escritura
+            flush_interval (float): Antigüedad máxima en segundos de lo pendiente
+            encoding (str): Codificación de los registros
+        """
+        super().__init__()
+        self.filename = os.fspath(filename)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+        self._fd = os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._buffers: List[bytes] = []
+        self._pending = 0
+        self._oldest = None
+        self._stop_flusher = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            payload = (self.format(record) + '\n').encode(self.encoding)
+            with self.lock:
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                self._buffers.append(payload)
+                self._pending += len(payload)
+                if self._pending >= self.flush_bytes:
+                    self._write_pending()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            self._write_pending()
+
+    def close(self):
+        self._stop_flusher.set()
+        with self.lock:
+            if self._fd is not None:
+                self._write_pending()
+                os.close(self._fd)
+                self._fd = None
+        super().close()
+
+    def _flush_loop(self):
+        """Vacía periódicamente los registros que superan flush_interval."""
+        while not self._stop_flusher.wait(self.flush_interval):
+            oldest = self._oldest
+            if oldest is not None and time.monotonic() - oldest >= self.flush_interval:
+                self.flush()
+
+    def _write_pending(self):
+        """Escribe todos los buffers pendientes. Debe llamarse con el lock tomado."""
+        buffers = self._buffers
+        self._buffers = []
+        self._pending = 0
+        self._oldest = None
+        if self._fd is None:
+            return
+        while buffers:
+            batch = buffers[:_IOV_MAX]
+            written = os.writev(self._fd, batch)
+            # Descartar lo escrito completo y reintentar escrituras parciales
+            consumed = 0
+            for chunk in batch:
+                if written < len(chunk):
+                    break
+                written -= len(chunk)
+                consumed += 1
+            if consumed < len(batch) and written:
+                buffers[consumed] = buffers[consumed][written:]
+            del buffers[:consumed]
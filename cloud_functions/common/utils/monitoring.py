@@ -9,18 +9,165 @@ Este módulo proporciona:
 5. Colección de estadísticas del sistema
 """
 import os
+import atexit
 import logging
 import json
+import queue
+import math
 import time
 import psutil
+import weakref
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Counter
-from functools import wraps
+from typing import Dict, Any, Optional, List
+from functools import wraps, lru_cache
 from pathlib import Path
-from collections import defaultdict, deque
-from threading import Lock
+from collections import OrderedDict, defaultdict, deque
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock, local
 
 from common.config.settings import LOG_LEVEL, LOG_FORMAT, ENVIRONMENT, DEBUG
+from common.utils.log_handlers import BatchedFileHandler
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_context(context: Dict[str, Any]) -> str:
+    """Serializa el contexto de un log (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.dumps(context, default=str).decode('utf-8')
+    return json.dumps(context, ensure_ascii=False, default=str)
+
+
+class ContextFormatter(logging.Formatter):
+    """
+    Formatter que agrega el contexto estructurado del registro al mensaje.
+    
+    El contexto viaja como objeto en el LogRecord y solo se serializa cuando
+    un handler efectivamente emite el registro.
+    """
+    
+    # Formato por defecto de LOG_FORMAT, que se arma sin pasar por Formatter.format
+    DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    
+    def __init__(self, fmt: str = None, datefmt: str = None):
+        super().__init__(fmt, datefmt)
+        self._fast_path = fmt == self.DEFAULT_FORMAT and datefmt is not None
+        self._cached_second = None
+        self._cached_time = None
+    
+    def formatTime(self, record: logging.LogRecord, datefmt: str = None) -> str:
+        # datefmt no incluye fracciones de segundo: se formatea una vez por segundo
+        if datefmt is None:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_time = time.strftime(datefmt, self.converter(second))
+            self._cached_second = second
+        return self._cached_time
+    
+    def format(self, record: logging.LogRecord) -> str:
+        if self._fast_path and not record.exc_info and not record.stack_info:
+            text = record.getMessage() if record.args else str(record.msg)
+            message = (f"{self.formatTime(record, self.datefmt)} - {record.name} - "
+                       f"{record.levelname} - {text}")
+        else:
+            message = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            message = f"{message} | Context: {_dumps_context(context)}"
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatter que emite cada registro como un documento JSON por línea.
+    
+    Usa las claves que Cloud Logging interpreta (severity, message) y agrega
+    los campos del contexto al mismo nivel, sin incrustarlos en el mensaje.
+    """
+    
+    def format(self, record: logging.LogRecord) -> str:
+        # El contexto va primero: una clave como 'message' o 'severity' no
+        # puede pisar los campos que interpreta Cloud Logging
+        context = getattr(record, 'context', None)
+        document = dict(context) if context else {}
+        document.update({
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        })
+        if record.exc_info:
+            document['exception'] = self.formatException(record.exc_info)
+        return _dumps_context(document)
+
+
+# Capacidad de la cola de logs; al llenarse se descartan registros
+LOG_QUEUE_SIZE = 10000
+
+# Espera máxima para vaciar las colas de logs al final de una invocación
+LOG_FLUSH_TIMEOUT_SECONDS = 2.0
+
+# Listeners activos por nombre de logger
+_queue_listeners: Dict[str, QueueListener] = {}
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler que descarta registros (y los cuenta) si la cola está llena."""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare formatea el mensaje en el hilo que loguea; el
+        # registro se encola tal cual y lo formatea el listener
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.increment_counter('log_dropped')
+
+
+def _stop_listener(listener: QueueListener):
+    """Detiene un listener (vaciando su cola) y cierra sus handlers."""
+    if listener._thread is not None:
+        listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def flush_logs(timeout: float = LOG_FLUSH_TIMEOUT_SECONDS):
+    """
+    Espera a que los listeners escriban los registros encolados.
+    
+    En Cloud Functions la CPU puede restringirse al responder: se llama al
+    final de cada invocación para no dejar registros pendientes en la cola.
+    
+    Args:
+        timeout (float): Espera máxima en segundos para todas las colas
+    """
+    deadline = time.monotonic() + timeout
+    for listener in list(_queue_listeners.values()):
+        log_queue = listener.queue
+        while log_queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+        for handler in listener.handlers:
+            handler.flush()
+
+
+@atexit.register
+def _stop_queue_listeners():
+    """Vacía las colas de logs pendientes al terminar el proceso."""
+    for listener in list(_queue_listeners.values()):
+        _stop_listener(listener)
+    _queue_listeners.clear()
 
 
 class DrCecimLogger:
@@ -40,70 +187,204 @@ class DrCecimLogger:
         self._setup_logger()
         
     def _setup_logger(self):
-        """Configura el logger con handlers apropiados."""
-        # Limpiar handlers existentes
+        """
+        Configura el logger con handlers apropiados.
+        
+        Los handlers reales (consola/archivo) corren en un QueueListener; el
+        logger solo encola registros en una cola acotada, así la escritura no
+        ocurre en el hilo que loguea.
+        """
+        # Limpiar handlers existentes y detener el listener previo del mismo
+        # nombre antes de abrir los nuevos handlers (cierra su archivo)
         self.logger.handlers.clear()
+        previous_listener = _queue_listeners.pop(self.name, None)
+        if previous_listener is not None:
+            _stop_listener(previous_listener)
         
         # Configurar nivel
         level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
         self.logger.setLevel(level)
         
         # Configurar formato
-        formatter = logging.Formatter(
+        formatter = ContextFormatter(
             LOG_FORMAT,
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         
-        # Handler para consola
+        # Handler para consola: JSON estructurado fuera de desarrollo, para que
+        # Cloud Logging indexe los campos del contexto
         console_handler = logging.StreamHandler()
         console_handler.setLevel(level)
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
+        if ENVIRONMENT == 'development':
+            console_handler.setFormatter(formatter)
+        else:
+            console_handler.setFormatter(JsonFormatter())
+        handlers = [console_handler]
         
         # Handler para archivo en desarrollo
         if ENVIRONMENT == 'development':
             log_dir = Path('logs')
             log_dir.mkdir(exist_ok=True)
             
-            file_handler = logging.FileHandler(log_dir / f'{self.name}.log')
+            file_handler = BatchedFileHandler(log_dir / f'{self.name}.log')
             file_handler.setLevel(level)
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+            handlers.append(file_handler)
+        
+        # Encolar en el hilo llamador y escribir desde el listener
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        self.queue_handler.setLevel(level)
+        self.logger.addHandler(self.queue_handler)
+        
+        # Un único listener por nombre de logger aunque se vuelva a configurar
+        self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        _queue_listeners[self.name] = self.listener
+    
+    def close(self):
+        """Detiene el listener, vaciando los registros pendientes."""
+        if _queue_listeners.get(self.name) is self.listener:
+            del _queue_listeners[self.name]
+        _stop_listener(self.listener)
     
-    def info(self, message: str, extra: Dict[str, Any] = None):
+    def info(self, message: str, extra: Dict[str, Any] = None, args: tuple = ()):
         """Log info message."""
-        self._log_with_context(logging.INFO, message, extra)
+        self._log_with_context(logging.INFO, message, extra, args)
     
-    def warning(self, message: str, extra: Dict[str, Any] = None):
+    def warning(self, message: str, extra: Dict[str, Any] = None, args: tuple = ()):
         """Log warning message."""
-        self._log_with_context(logging.WARNING, message, extra)
+        self._log_with_context(logging.WARNING, message, extra, args)
     
-    def error(self, message: str, extra: Dict[str, Any] = None):
+    def error(self, message: str, extra: Dict[str, Any] = None, args: tuple = ()):
         """Log error message."""
-        self._log_with_context(logging.ERROR, message, extra)
+        self._log_with_context(logging.ERROR, message, extra, args)
     
-    def debug(self, message: str, extra: Dict[str, Any] = None):
+    def debug(self, message: str, extra: Dict[str, Any] = None, args: tuple = ()):
         """Log debug message."""
-        self._log_with_context(logging.DEBUG, message, extra)
+        self._log_with_context(logging.DEBUG, message, extra, args)
     
-    def _log_with_context(self, level: int, message: str, extra: Dict[str, Any] = None):
-        """Log con contexto adicional."""
-        if extra:
-            context = json.dumps(extra, ensure_ascii=False)
-            message = f"{message} | Context: {context}"
+    def _log_with_context(self, level: int, message: str, extra: Dict[str, Any] = None,
+                          args: tuple = ()):
+        """
+        Log con contexto adicional.
         
-        self.logger.log(level, message)
+        Los args se interpolan en el mensaje con formato % solo si el
+        registro llega a emitirse.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        
+        self.logger.log(level, message, *args, extra={'context': extra} if extra else None)
+
+
+@lru_cache(maxsize=4096)
+def _build_metric_key(metric_name: str, labels: frozenset) -> str:
+    """
+    Construye la clave canónica de una métrica con labels.
+    
+    Cacheada para no ordenar ni formatear los labels en cada evento.
+    """
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels))
+    return f"{metric_name}_{label_str}"
+
+
+class _ShardOwner:
+    """Marcador por hilo cuya liberación indica que el hilo terminó."""
+    __slots__ = ('__weakref__',)
 
 
 class MetricsCollector:
     """
     Colector de métricas para el sistema.
+    
+    Cada hilo escribe en su propio shard (threading.local), de modo que el
+    camino caliente no toma locks ni comparte escrituras. Los shards se
+    agregan recién al leer las métricas con get_metrics(). Cuando un hilo
+    termina, su shard se suma a un total acumulado y se descarta, así los
+    hilos de corta vida (pools por llamada) no retienen memoria.
     """
     
-    def __init__(self):
-        """Inicializa el colector de métricas."""
-        self.metrics = defaultdict(lambda: {'counters': defaultdict(int), 'gauges': {}, 'histograms': defaultdict(list)})
-        self.lock = Lock()
+    def __init__(self, histogram_size: int = 2048):
+        """
+        Inicializa el colector de métricas.
+        
+        Args:
+            histogram_size (int): Tamaño del buffer circular de cada histograma (por hilo)
+        """
+        self.histogram_size = histogram_size
+        self._local = local()
+        # id del dueño del shard -> shard de un hilo vivo
+        self._shards: Dict[int, Dict[str, Any]] = {}
+        # Métricas de los hilos que ya terminaron
+        self._retired = self._new_shard()
+        # Solo se toma al registrar o retirar el shard de un hilo y al agregar
+        self._shards_lock = Lock()
+        # Gauges: última escritura gana; la asignación de un item es atómica
+        self._gauges = {}
+        self.start_time = time.time()
+    
+    def _new_shard(self) -> Dict[str, Any]:
+        """Crea el almacenamiento de métricas de un hilo."""
+        return {
+            # clave -> [valor, nombre de métrica]; el incremento es un único
+            # `entry[0] += value` sobre la lista ya resuelta
+            'counters': defaultdict(lambda: [0, None]),
+            # (nombre de métrica, clave) -> histograma
+            'histograms': defaultdict(self._new_histogram)
+        }
+    
+    def _new_histogram(self) -> Dict[str, Any]:
+        """
+        Crea un histograma: buffer circular de valores para percentiles y
+        acumuladores en línea para count/mean/stddev/min/max exactos.
+        """
+        return {
+            'ring': deque(maxlen=self.histogram_size),
+            'count': 0,
+            'sum': 0.0,
+            'sumsq': 0.0,
+            'min': math.inf,
+            'max': -math.inf,
+            'last_updated': None
+        }
+    
+    def _get_shard(self) -> Dict[str, Any]:
+        """Obtiene (o registra) el shard de métricas del hilo actual."""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._new_shard()
+            # El dueño vive solo en el threading.local del hilo: al terminar
+            # el hilo se libera y el finalizador retira su shard
+            owner = _ShardOwner()
+            with self._shards_lock:
+                self._shards[id(owner)] = shard
+            finalizer = weakref.finalize(owner, self._retire_shard, id(owner))
+            finalizer.atexit = False
+            self._local.owner = owner
+            self._local.shard = shard
+        return shard
+    
+    def _retire_shard(self, owner_id: int):
+        """Suma el shard de un hilo terminado al total acumulado y lo descarta."""
+        with self._shards_lock:
+            shard = self._shards.pop(owner_id, None)
+            if shard is None:
+                return
+            retired = self._retired
+            for key, (value, metric_name) in shard['counters'].items():
+                entry = retired['counters'][key]
+                entry[0] += value
+                entry[1] = metric_name
+            for metric_key, histogram in shard['histograms'].items():
+                total = retired['histograms'][metric_key]
+                total['ring'].extend(histogram['ring'])
+                total['count'] += histogram['count']
+                total['sum'] += histogram['sum']
+                total['sumsq'] += histogram['sumsq']
+                total['min'] = min(total['min'], histogram['min'])
+                total['max'] = max(total['max'], histogram['max'])
+                total['last_updated'] = max(total['last_updated'] or 0, histogram['last_updated'] or 0)
     
     def increment_counter(self, metric_name: str, value: int = 1, labels: Dict[str, str] = None):
         """
@@ -114,9 +395,11 @@ class MetricsCollector:
             value (int): Valor a incrementar
             labels (Dict[str, str]): Labels para la métrica
         """
-        with self.lock:
-            key = self._get_metric_key(metric_name, labels)
-            self.metrics[metric_name]['counters'][key] += value
+        key = self._get_metric_key(metric_name, labels)
+        entry = self._get_shard()['counters'][key]
+        entry[0] += value
+        if entry[1] is None:
+            entry[1] = metric_name
     
     def set_gauge(self, metric_name: str, value: float, labels: Dict[str, str] = None):
         """
@@ -127,9 +410,8 @@ class MetricsCollector:
             value (float): Valor del gauge
             labels (Dict[str, str]): Labels para la métrica
         """
-        with self.lock:
-            key = self._get_metric_key(metric_name, labels)
-            self.metrics[metric_name]['gauges'][key] = value
+        key = self._get_metric_key(metric_name, labels)
+        self._gauges[(metric_name, key)] = value
     
     def record_histogram(self, metric_name: str, value: float, labels: Dict[str, str] = None):
         """
@@ -140,9 +422,17 @@ class MetricsCollector:
             value (float): Valor a registrar
             labels (Dict[str, str]): Labels para la métrica
         """
-        with self.lock:
-            key = self._get_metric_key(metric_name, labels)
-            self.metrics[metric_name]['histograms'][key].append(value)
+        key = self._get_metric_key(metric_name, labels)
+        histogram = self._get_shard()['histograms'][(metric_name, key)]
+        histogram['ring'].append(value)
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['sumsq'] += value * value
+        if value < histogram['min']:
+            histogram['min'] = value
+        if value > histogram['max']:
+            histogram['max'] = value
+        histogram['last_updated'] = time.time()
     
     def emit_cloud_monitoring_metrics(self, document_id: str, num_vectors: int, duration: float):
         """
@@ -189,14 +479,73 @@ class MetricsCollector:
     def _get_metric_key(self, metric_name: str, labels: Dict[str, str] = None) -> str:
         """Genera una clave única para la métrica."""
         if labels:
-            label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
-            return f"{metric_name}_{label_str}"
+            return _build_metric_key(metric_name, frozenset(labels.items()))
         return metric_name
     
+    def _aggregate_shards(self) -> Dict[str, Any]:
+        """Combina los shards de todos los hilos en una única vista."""
+        metrics = defaultdict(lambda: {'counters': defaultdict(int), 'gauges': {}, 'histograms': {}})
+        histogram_parts = defaultdict(list)
+        
+        with self._shards_lock:
+            shards = list(self._shards.values())
+            shards.append(self._retired)
+        
+        for shard in shards:
+            for key, (value, metric_name) in list(shard['counters'].items()):
+                metrics[metric_name]['counters'][key] += value
+            for metric_key, histogram in list(shard['histograms'].items()):
+                histogram_parts[metric_key].append(histogram)
+        
+        for (metric_name, key), parts in histogram_parts.items():
+            metrics[metric_name]['histograms'][key] = self._summarize_histogram(parts)
+        
+        for (metric_name, key), value in list(self._gauges.items()):
+            metrics[metric_name]['gauges'][key] = value
+        
+        return metrics
+    
+    @staticmethod
+    def _summarize_histogram(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Combina los histogramas de varios hilos en un resumen.
+        
+        Args:
+            parts (List[Dict[str, Any]]): Histogramas de cada shard
+            
+        Returns:
+            Dict[str, Any]: count, mean, stddev, min, max, p50 y p95
+        """
+        count = sum(part['count'] for part in parts)
+        if not count:
+            return {'count': 0}
+        
+        total = sum(part['sum'] for part in parts)
+        total_sq = sum(part['sumsq'] for part in parts)
+        mean = total / count
+        variance = max(total_sq / count - mean * mean, 0.0)
+        
+        samples = sorted(value for part in parts for value in list(part['ring']))
+        
+        def percentile(q: float) -> float:
+            return samples[min(int(q * len(samples)), len(samples) - 1)]
+        
+        return {
+            'count': count,
+            'sum': total,
+            'mean': mean,
+            'stddev': math.sqrt(variance),
+            'min': min(part['min'] for part in parts),
+            'max': max(part['max'] for part in parts),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'last_updated': max((part['last_updated'] or 0) for part in parts)
+        }
+    
     def get_metrics(self) -> Dict[str, Any]:
         """Obtiene todas las métricas."""
         return {
-            'metrics': self.metrics,
+            'metrics': self._aggregate_shards(),
             'system': {
                 'uptime': time.time() - self.start_time,
                 'timestamp': datetime.now().isoformat()
@@ -205,7 +554,11 @@ class MetricsCollector:
     
     def reset_metrics(self):
         """Reinicia todas las métricas."""
-        self.metrics.clear()
+        with self._shards_lock:
+            for shard in list(self._shards.values()) + [self._retired]:
+                shard['counters'].clear()
+                shard['histograms'].clear()
+        self._gauges.clear()
         self.start_time = time.time()
 
 
@@ -214,6 +567,9 @@ class ProcessingMonitor:
     Monitor específico para el procesamiento de documentos.
     """
     
+    # Máximo de sesiones retenidas en memoria
+    MAX_SESSIONS = 1024
+    
     def __init__(self, logger: DrCecimLogger, metrics: MetricsCollector):
         """
         Inicializa el monitor.
@@ -224,7 +580,41 @@ class ProcessingMonitor:
         """
         self.logger = logger
         self.metrics = metrics
-        self.processing_sessions = {}
+        
+        # Estado de sesiones por columnas (session_id -> valor); el orden de
+        # _status define qué sesión se descarta primero al superar MAX_SESSIONS
+        self._status: OrderedDict = OrderedDict()
+        self._filename: Dict[str, str] = {}
+        self._start: Dict[str, float] = {}
+        self._start_ns: Dict[str, int] = {}
+        self._steps: Dict[str, List[Dict[str, Any]]] = {}
+        self._end: Dict[str, float] = {}
+        self._processing_time: Dict[str, float] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._error: Dict[str, str] = {}
+        
+        # Conteo de sesiones por estado, mantenido en cada transición
+        self._counts = {'started': 0, 'completed': 0, 'failed': 0}
+    
+    @property
+    def processing_sessions(self) -> Dict[str, Dict[str, Any]]:
+        """Vista por sesión del estado almacenado en columnas."""
+        sessions = {}
+        for session_id, status in self._status.items():
+            session = {
+                'filename': self._filename[session_id],
+                'start_time': self._start[session_id],
+                'steps': self._steps[session_id],
+                'status': status
+            }
+            if session_id in self._end:
+                session['end_time'] = self._end[session_id]
+                session['processing_time'] = self._processing_time[session_id]
+                session['results'] = self._results[session_id]
+            if session_id in self._error:
+                session['error_message'] = self._error[session_id]
+            sessions[session_id] = session
+        return sessions
     
     def start_processing(self, filename: str, session_id: str = None) -> str:
         """
@@ -240,14 +630,16 @@ class ProcessingMonitor:
         if not session_id:
             session_id = f"proc_{int(time.time())}"
         
-        self.processing_sessions[session_id] = {
-            'filename': filename,
-            'start_time': time.time(),
-            'steps': [],
-            'status': 'started'
-        }
+        self._set_status(session_id, 'started')
+        self._filename[session_id] = filename
+        self._start[session_id] = time.time()
+        self._start_ns[session_id] = time.monotonic_ns()
+        self._steps[session_id] = []
+        
+        while len(self._status) > self.MAX_SESSIONS:
+            self._evict_oldest()
         
-        self.logger.info(f"Iniciando procesamiento", {
+        self.logger.info("Iniciando procesamiento", {
             'session_id': session_id,
             'filename': filename
         })
@@ -267,8 +659,8 @@ class ProcessingMonitor:
             step_name (str): Nombre del paso
             details (Dict[str, Any]): Detalles adicionales
         """
-        if session_id not in self.processing_sessions:
-            self.logger.warning(f"Sesión no encontrada: {session_id}")
+        if session_id not in self._status:
+            self.logger.warning("Sesión no encontrada: %s", args=(session_id,))
             return
         
         step_data = {
@@ -277,12 +669,12 @@ class ProcessingMonitor:
             'details': details or {}
         }
         
-        self.processing_sessions[session_id]['steps'].append(step_data)
+        self._steps[session_id].append(step_data)
         
-        self.logger.info(f"Paso completado: {step_name}", {
+        self.logger.info("Paso completado: %s", {
             'session_id': session_id,
             'step_details': details
-        })
+        }, args=(step_name,))
         
         self.metrics.increment_counter('processing_steps_completed', labels={
             'step_name': step_name
@@ -299,33 +691,35 @@ class ProcessingMonitor:
             error_message (str): Mensaje de error (si aplica)
             results (Dict[str, Any]): Resultados del procesamiento
         """
-        if session_id not in self.processing_sessions:
-            self.logger.warning(f"Sesión no encontrada: {session_id}")
+        if session_id not in self._status:
+            self.logger.warning("Sesión no encontrada: %s", args=(session_id,))
             return
         
-        session = self.processing_sessions[session_id]
-        processing_time = time.time() - session['start_time']
+        filename = self._filename[session_id]
+        end_time = time.time()
+        processing_time = (time.monotonic_ns() - self._start_ns[session_id]) / 1e9
         
-        session['status'] = 'completed' if success else 'failed'
-        session['end_time'] = time.time()
-        session['processing_time'] = processing_time
-        session['results'] = results or {}
+        self._set_status(session_id, 'completed' if success else 'failed')
+        self._status.move_to_end(session_id)
+        self._end[session_id] = end_time
+        self._processing_time[session_id] = processing_time
+        self._results[session_id] = results or {}
         
         if error_message:
-            session['error_message'] = error_message
+            self._error[session_id] = error_message
         
         # Log final
         if success:
-            self.logger.info(f"Procesamiento completado exitosamente", {
+            self.logger.info("Procesamiento completado exitosamente", {
                 'session_id': session_id,
-                'filename': session['filename'],
+                'filename': filename,
                 'processing_time': processing_time,
                 'results': results
             })
         else:
-            self.logger.error(f"Procesamiento falló", {
+            self.logger.error("Procesamiento falló", {
                 'session_id': session_id,
-                'filename': session['filename'],
+                'filename': filename,
                 'processing_time': processing_time,
                 'error': error_message
             })
@@ -333,29 +727,40 @@ class ProcessingMonitor:
         # Métricas
         self.metrics.increment_counter('documents_processed', labels={
             'status': 'success' if success else 'error',
-            'filename': session['filename']
+            'filename': filename
         })
         
         self.metrics.record_histogram('processing_time_seconds', processing_time, labels={
-            'filename': session['filename']
+            'filename': filename
         })
         
         if results:
             self.metrics.set_gauge('last_processed_chunks', results.get('num_chunks', 0))
             self.metrics.set_gauge('last_processed_words', results.get('total_words', 0))
     
+    def _set_status(self, session_id: str, status: str):
+        """Actualiza el estado de una sesión manteniendo el conteo por estado."""
+        previous = self._status.get(session_id)
+        if previous is not None:
+            self._counts[previous] -= 1
+        self._status[session_id] = status
+        self._counts[status] += 1
+    
+    def _evict_oldest(self):
+        """Descarta la sesión menos reciente de todas las columnas."""
+        session_id, status = self._status.popitem(last=False)
+        self._counts[status] -= 1
+        for column in (self._filename, self._start, self._start_ns, self._steps, self._end,
+                       self._processing_time, self._results, self._error):
+            column.pop(session_id, None)
+        self.metrics.increment_counter('sessions_evicted')
+    
     def get_processing_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas de procesamiento."""
-        active_sessions = {k: v for k, v in self.processing_sessions.items() 
-                          if v['status'] == 'started'}
-        
-        completed_sessions = {k: v for k, v in self.processing_sessions.items() 
-                             if v['status'] in ['completed', 'failed']}
-        
         return {
-            'active_sessions': len(active_sessions),
-            'completed_sessions': len(completed_sessions),
-            'total_sessions': len(self.processing_sessions),
+            'active_sessions': self._counts['started'],
+            'completed_sessions': self._counts['completed'] + self._counts['failed'],
+            'total_sessions': len(self._status),
             'sessions': self.processing_sessions
         }
 
@@ -370,45 +775,50 @@ def monitor_function(logger: DrCecimLogger, metrics: MetricsCollector):
         metrics (MetricsCollector): Colector de métricas
     """
     def decorator(func):
+        # Todo lo que no depende de la llamada se resuelve una sola vez aquí
+        function_name = func.__name__
+        start_message = f"Iniciando función: {function_name}"
+        success_message = f"Función completada: {function_name}"
+        error_message = f"Error en función: {function_name}"
+        call_labels = {'function': function_name}
+        success_labels = {'function': function_name, 'status': 'success'}
+        error_labels = {'function': function_name, 'status': 'error'}
+        log_info = logger.info
+        log_error = logger.error
+        increment_counter = metrics.increment_counter
+        record_histogram = metrics.record_histogram
+        monotonic_ns = time.monotonic_ns
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            function_name = func.__name__
-            start_time = time.time()
+            start_ns = monotonic_ns()
             
-            logger.info(f"Iniciando función: {function_name}")
-            metrics.increment_counter('function_calls', labels={'function': function_name})
+            log_info(start_message)
+            increment_counter('function_calls', labels=call_labels)
             
             try:
                 result = func(*args, **kwargs)
-                execution_time = time.time() - start_time
+                execution_time = (monotonic_ns() - start_ns) / 1e9
                 
-                logger.info(f"Función completada: {function_name}", {
+                log_info(success_message, {
                     'execution_time': execution_time
                 })
                 
-                metrics.record_histogram('function_execution_time', execution_time, labels={
-                    'function': function_name,
-                    'status': 'success'
-                })
+                record_histogram('function_execution_time', execution_time, labels=success_labels)
                 
                 return result
                 
             except Exception as e:
-                execution_time = time.time() - start_time
+                execution_time = (monotonic_ns() - start_ns) / 1e9
                 
-                logger.error(f"Error en función: {function_name}", {
+                log_error(error_message, {
                     'execution_time': execution_time,
                     'error': str(e)
                 })
                 
-                metrics.increment_counter('function_errors', labels={
-                    'function': function_name
-                })
+                increment_counter('function_errors', labels=call_labels)
                 
-                metrics.record_histogram('function_execution_time', execution_time, labels={
-                    'function': function_name,
-                    'status': 'error'
-                })
+                record_histogram('function_execution_time', execution_time, labels=error_labels)
                 
                 raise
         
@@ -418,16 +828,20 @@ def monitor_function(logger: DrCecimLogger, metrics: MetricsCollector):
 
 # Instancias globales
 logger = DrCecimLogger()
+_named_loggers: Dict[str, DrCecimLogger] = {}
 metrics = MetricsCollector()
 processing_monitor = ProcessingMonitor(logger, metrics)
 
 
 # Funciones de conveniencia
 def get_logger(name: str = None) -> DrCecimLogger:
-    """Obtiene un logger."""
-    if name:
-        return DrCecimLogger(name)
-    return logger
+    """Obtiene un logger (uno por nombre, configurado una sola vez)."""
+    if not name:
+        return logger
+    named_logger = _named_loggers.get(name)
+    if named_logger is None:
+        named_logger = _named_loggers.setdefault(name, DrCecimLogger(name))
+    return named_logger
 
 
 def get_metrics() -> MetricsCollector:
@@ -453,10 +867,13 @@ processing_monitor = ProcessingMonitor(logger, metrics)
 
 # Funciones de conveniencia
 def get_logger(name: str = None) -> DrCecimLogger:
-    """Obtiene un logger."""
-    if name:
-        return DrCecimLogger(name)
-    return logger
+    """Obtiene un logger (uno por nombre, configurado una sola vez)."""
+    if not name:
+        return logger
+    named_logger = _named_loggers.get(name)
+    if named_logger is None:
+        named_logger = _named_loggers.setdefault(name, DrCecimLogger(name))
+    return named_logger
 
 
 def get_metrics() -> MetricsCollector:
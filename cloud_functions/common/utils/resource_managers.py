@@ -3,13 +3,28 @@ Gestores de recursos para el procesamiento de documentos.
 Proporciona context managers para manejar recursos de manera segura.
 """
 import os
+import sys
+import shutil
+import signal
 import logging
+import threading
 import time
 import uuid
 from typing import Generator, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # No disponible fuera de POSIX
+    resource = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -47,6 +62,166 @@ def document_processing_context(
             _cleanup_resources(context['resources'])
 
 
+class ProcessingCancelledError(RuntimeError):
+    """El procesamiento se canceló por timeout o por exceder el límite de memoria."""
+
+
+def raise_if_cancelled(context: dict, step: str) -> None:
+    """
+    Verifica en un punto seguro si la región pidió cancelar el procesamiento.
+    
+    Args:
+        context: Contexto de with_processing_resources
+        step: Paso que estaba por comenzar (para el mensaje de error)
+        
+    Raises:
+        ProcessingCancelledError: Si se solicitó la cancelación
+    """
+    if not context['cancel'].is_set():
+        return
+    if context.get('memory_exceeded', False):
+        reason = f"límite de memoria de {context['max_memory_mb']}MB excedido"
+    else:
+        reason = f"timeout de {context['timeout_seconds']} segundos alcanzado"
+    raise ProcessingCancelledError(f"Procesamiento cancelado antes de '{step}': {reason}")
+
+
+# Handle del proceso actual, reutilizado entre lecturas de memoria
+_PROCESS = None
+
+
+def _rss_mb() -> Optional[float]:
+    """
+    Obtiene la memoria residente del proceso actual en MB.
+    
+    Usa un psutil.Process cacheado; si psutil no está disponible recurre al
+    pico de memoria residente (ru_maxrss).
+    
+    Returns:
+        Optional[float]: Memoria residente en MB, o None si no está disponible
+    """
+    global _PROCESS
+    if psutil is not None:
+        if _PROCESS is None or _PROCESS.pid != os.getpid():
+            _PROCESS = psutil.Process()
+        return _PROCESS.memory_info().rss / (1024 * 1024)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss se reporta en bytes en macOS y en KB en Linux
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+# Sampler compartido por todas las regiones de with_processing_resources:
+# un único hilo revisa cada segundo la memoria y los deadlines (cuando no se
+# puede usar SIGALRM) de las regiones activas (id(context) -> context)
+_ACTIVE_CONTEXTS = {}
+_SAMPLER_LOCK = threading.Lock()
+_SAMPLER_THREAD = None
+
+# Segundos que se espera a que el bloque atienda la cancelación antes de
+# interrumpirlo con TimeoutError
+CANCEL_GRACE_SECONDS = 10
+
+
+def _raise_in_thread(thread_id: int, exception: type) -> bool:
+    """
+    Lanza una excepción de forma asíncrona en otro hilo de Python.
+    
+    Args:
+        thread_id: Identificador del hilo destino
+        exception: Clase de excepción a lanzar
+        
+    Returns:
+        bool: True si la excepción quedó programada
+    """
+    import ctypes
+    
+    affected = ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exception)
+    )
+    if affected > 1:
+        # No debería ocurrir; revertir para no afectar otros hilos
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+        return False
+    return affected == 1
+
+
+def _clear_async_exc(thread_id: int) -> None:
+    """
+    Revoca una excepción asíncrona pendiente en un hilo (si la hay).
+    
+    Args:
+        thread_id: Identificador del hilo
+    """
+    import ctypes
+    
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+
+
+def _check_memory(context: dict, current_memory: Optional[float]) -> None:
+    """Solicita la cancelación de una región que superó su límite de memoria."""
+    max_memory_mb = context['max_memory_mb']
+    if not max_memory_mb or current_memory is None or context.get('memory_exceeded', False):
+        return
+    memory_used_mb = current_memory - context['start_memory']
+    if memory_used_mb > max_memory_mb:
+        context['memory_exceeded'] = True
+        context['cancel'].set()
+        logger.error(f"Límite de memoria {max_memory_mb}MB excedido ({memory_used_mb:.2f}MB), "
+                     f"solicitando cancelación")
+
+
+def _check_deadline(context: dict, now: float) -> None:
+    """Cancela y, pasado el período de gracia, interrumpe una región vencida."""
+    deadline = context.get('deadline')
+    if deadline is None or now < deadline:
+        return
+    if not context['timeout_triggered']:
+        # Primero se pide al bloque que se detenga por sí mismo
+        context['timeout_triggered'] = True
+        context['cancel'].set()
+        logger.error(f"Timeout de {context['timeout_seconds']} segundos alcanzado, "
+                     f"solicitando cancelación")
+    elif now >= deadline + CANCEL_GRACE_SECONDS and not context.get('interrupted', False):
+        # Bajo el mismo lock que el cierre de la región: si el bloque ya
+        # terminó no se programa nada, y si se programa, el cierre lo revoca
+        with context['interrupt_lock']:
+            if context.get('completed', False):
+                return
+            context['interrupted'] = True
+            logger.error("El bloque no atendió la cancelación, interrumpiendo con TimeoutError")
+            _raise_in_thread(context['thread_id'], TimeoutError)
+
+
+def _resource_sampler() -> None:
+    """Hilo único que revisa los límites de todas las regiones activas."""
+    while True:
+        contexts = list(_ACTIVE_CONTEXTS.values())
+        if contexts:
+            now = time.monotonic()
+            current_memory = _rss_mb()
+            for context in contexts:
+                if context.get('completed', False):
+                    continue
+                _check_memory(context, current_memory)
+                _check_deadline(context, now)
+        time.sleep(1)
+
+
+def _register_context(context: dict) -> None:
+    """Registra una región en el sampler compartido, iniciándolo si hace falta."""
+    global _SAMPLER_THREAD
+    _ACTIVE_CONTEXTS[id(context)] = context
+    if _SAMPLER_THREAD is None:
+        with _SAMPLER_LOCK:
+            if _SAMPLER_THREAD is None:
+                _SAMPLER_THREAD = threading.Thread(target=_resource_sampler, daemon=True)
+                _SAMPLER_THREAD.start()
+
+
 @contextmanager
 def with_processing_resources(
     temp_dir: Optional[str] = None,
@@ -56,6 +231,13 @@ def with_processing_resources(
     """
     Context manager para recursos de procesamiento con límites.
     
+    El timeout se aplica con SIGALRM (levanta TimeoutError dentro del bloque)
+    cuando se ejecuta en el hilo principal; en otro caso se usa un sampler
+    compartido que marca context['cancel'] y, si el bloque no termina tras
+    CANCEL_GRACE_SECONDS, lo interrumpe con TimeoutError. El mismo sampler
+    verifica el límite de memoria (memoria residente del proceso) y
+    marca context['cancel'] si se supera; también se verifica al salir.
+    
     Args:
         temp_dir: Directorio temporal
         max_memory_mb: Límite de memoria en MB
@@ -64,12 +246,9 @@ def with_processing_resources(
     Yields:
         dict: Contexto con recursos de procesamiento
     """
-    import psutil
-    import threading
-    import os
-    
     start_time = time.time()
-    start_memory = psutil.virtual_memory().used
+    start_ns = time.monotonic_ns()
+    start_memory = _rss_mb()
     
     context = {
         'temp_dir': temp_dir,
@@ -78,59 +257,70 @@ def with_processing_resources(
         'max_memory_mb': max_memory_mb,
         'timeout_seconds': timeout_seconds,
         'resources': [],
-        'timeout_triggered': False
+        'timeout_triggered': False,
+        # Los bloques largos deben revisar cancel.is_set() en puntos seguros
+        'cancel': threading.Event(),
+        'thread_id': threading.get_ident(),
+        # Sincroniza la interrupción asíncrona del sampler con el cierre
+        'interrupt_lock': threading.Lock()
     }
     
-    def timeout_checker():
-        """Thread para verificar timeout manualmente"""
-        if timeout_seconds:
-            time.sleep(timeout_seconds)
-            if not context.get('completed', False):
-                context['timeout_triggered'] = True
-                # En entornos serverless, la mejor opción es terminar el proceso
-                logger.error(f"Timeout de {timeout_seconds} segundos alcanzado")
-                os._exit(1)  # Terminar proceso de forma abrupta
-    
-    def memory_checker():
-        """Thread para verificar uso de memoria"""
-        if max_memory_mb:
-            while not context.get('completed', False):
-                current_memory = psutil.virtual_memory().used
-                memory_used_mb = (current_memory - start_memory) / (1024 * 1024)
-                if memory_used_mb > max_memory_mb:
-                    context['timeout_triggered'] = True
-                    logger.error(f"Límite de memoria {max_memory_mb}MB excedido")
-                    os._exit(1)
-                time.sleep(1)  # Verificar cada segundo
-    
-    timeout_thread = None
-    memory_thread = None
+    def timeout_handler(signum, frame):
+        context['timeout_triggered'] = True
+        context['cancel'].set()
+        raise TimeoutError(f"Timeout de {timeout_seconds} segundos alcanzado")
+    
+    use_alarm = (
+        bool(timeout_seconds)
+        and hasattr(signal, 'setitimer')
+        and threading.current_thread() is threading.main_thread()
+    )
+    previous_handler = None
     
     try:
-        # Iniciar threads de monitoreo si se especifican límites
-        if timeout_seconds:
-            timeout_thread = threading.Thread(target=timeout_checker, daemon=True)
-            timeout_thread.start()
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, timeout_handler)
+            signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+        elif timeout_seconds:
+            context['deadline'] = time.monotonic() + timeout_seconds
         
-        if max_memory_mb:
-            memory_thread = threading.Thread(target=memory_checker, daemon=True)
-            memory_thread.start()
+        if max_memory_mb or 'deadline' in context:
+            _register_context(context)
         
         yield context
         
     finally:
-        # Marcar como completado para detener threads
-        context['completed'] = True
+        # Cerrar la región antes que nada: el sampler ya no puede programar
+        # la interrupción, y una programada que aún no se disparó se revoca
+        # para que no salte en otro código del mismo hilo (los hilos de
+        # request se reutilizan)
+        with context['interrupt_lock']:
+            context['completed'] = True
+            if context.get('interrupted', False):
+                _clear_async_exc(context['thread_id'])
+        _ACTIVE_CONTEXTS.pop(id(context), None)
+        
+        # Desactivar el timeout antes de limpiar
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
         
         # Limpiar recursos
         _cleanup_resources(context['resources'])
         
         # Log de uso de recursos
-        elapsed_time = time.time() - start_time
-        current_memory = psutil.virtual_memory().used
-        memory_used_mb = (current_memory - start_memory) / (1024 * 1024)
-        
-        logger.info(f"Recursos utilizados - Tiempo: {elapsed_time:.2f}s, Memoria: {memory_used_mb:.2f}MB")
+        elapsed_time = (time.monotonic_ns() - start_ns) / 1e9
+        end_memory = _rss_mb()
+        if end_memory is not None:
+            memory_used_mb = end_memory - start_memory
+            context['memory_used_mb'] = memory_used_mb
+            # La plataforma matará el contenedor por OOM; aquí solo se reporta
+            if max_memory_mb and memory_used_mb > max_memory_mb and not context.get('memory_exceeded'):
+                context['memory_exceeded'] = True
+                logger.error(f"Límite de memoria {max_memory_mb}MB excedido ({memory_used_mb:.2f}MB)")
+            logger.info(f"Recursos utilizados - Tiempo: {elapsed_time:.2f}s, Memoria: {memory_used_mb:.2f}MB")
+        else:
+            logger.info(f"Recursos utilizados - Tiempo: {elapsed_time:.2f}s")
 
 
 @contextmanager
@@ -152,6 +342,7 @@ def processing_session_context(
         session_id = str(uuid.uuid4())
     
     start_time = time.time()
+    start_ns = time.monotonic_ns()
     
     context = {
         'session_id': session_id,
@@ -172,7 +363,7 @@ def processing_session_context(
         logger.error(f"Sesión falló: {session_id} - {str(e)}")
         raise
     finally:
-        elapsed_time = time.time() - start_time
+        elapsed_time = (time.monotonic_ns() - start_ns) / 1e9
         context['elapsed_time'] = elapsed_time
         logger.info(f"Sesión finalizada: {session_id} - Tiempo: {elapsed_time:.2f}s")
 
@@ -193,14 +384,10 @@ def gcs_client_context(
         Any: Cliente de GCS configurado
     """
     try:
-        from google.cloud import storage
+        from common.services.gcs_service import get_storage_client
         
-        # Configurar credenciales si se proporcionan
-        if credentials_path and os.path.exists(credentials_path):
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
-        
-        # Crear cliente
-        client = storage.Client()
+        # Cliente compartido para estas credenciales (mismo caché que GCSService)
+        client = get_storage_client(credentials_path)
         
         # Obtener bucket si se especifica
         bucket = None
@@ -268,24 +455,46 @@ def openai_client_context(
         yield {'client': None, 'model': model, 'timeout': timeout}
 
 
+def _cleanup_resource(resource: Any) -> None:
+    """
+    Elimina un recurso (archivo o directorio) de procesamiento.
+    
+    Args:
+        resource: Ruta del recurso a limpiar
+    """
+    try:
+        if isinstance(resource, str) and os.path.exists(resource):
+            if os.path.isfile(resource):
+                os.unlink(resource)
+            elif os.path.isdir(resource):
+                shutil.rmtree(resource, onerror=_log_cleanup_error)
+            logger.debug(f"Recurso limpiado: {resource}")
+    except (OSError, PermissionError) as e:
+        logger.warning(f"No se pudo limpiar recurso {resource}: {e}")
+
+
+def _log_cleanup_error(function, path, exc_info) -> None:
+    """Registra un error de shutil.rmtree sin interrumpir la limpieza."""
+    logger.warning(f"No se pudo limpiar recurso {path}: {exc_info[1]}")
+
+
 def _cleanup_resources(resources: list) -> None:
     """
     Limpia recursos de procesamiento.
     
+    Las eliminaciones son llamadas bloqueantes al sistema que liberan el GIL,
+    por lo que con muchos recursos se ejecutan en paralelo.
+    
     Args:
         resources: Lista de recursos a limpiar
     """
-    for resource in resources:
-        try:
-            if isinstance(resource, str) and os.path.exists(resource):
-                if os.path.isfile(resource):
-                    os.unlink(resource)
-                elif os.path.isdir(resource):
-                    import shutil
-                    shutil.rmtree(resource)
-                logger.debug(f"Recurso limpiado: {resource}")
-        except (OSError, PermissionError) as e:
-            logger.warning(f"No se pudo limpiar recurso {resource}: {e}")
+    if len(resources) <= 2:
+        for resource in resources:
+            _cleanup_resource(resource)
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(8, len(resources))) as executor:
+        list(executor.map(_cleanup_resource, resources))
 
 
 @contextmanager
@@ -333,8 +542,9 @@ def memory_context() -> Generator[dict, None, None]:
     """
     import gc
     
+    # sys.getallocatedblocks es O(1), a diferencia de recorrer gc.get_objects()
     context = {
-        'initial_objects': len(gc.get_objects())
+        'initial_blocks': sys.getallocatedblocks()
     }
     
     try:
@@ -342,7 +552,9 @@ def memory_context() -> Generator[dict, None, None]:
     finally:
         # Forzar garbage collection
         collected = gc.collect()
-        logger.debug(f"Garbage collection: {collected} objetos recolectados")
+        context['allocated_blocks_delta'] = sys.getallocatedblocks() - context['initial_blocks']
+        logger.debug(f"Garbage collection: {collected} objetos recolectados, "
+                     f"bloques asignados: {context['allocated_blocks_delta']:+d}")
 
 
 @contextmanager
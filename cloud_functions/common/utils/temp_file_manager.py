@@ -81,11 +81,18 @@ class TempFileManager:
         """Limpia todos los archivos y directorios temporales creados."""
         for temp_path in self._temp_files:
             try:
-                if os.path.isfile(temp_path):
+                # Intentar directamente en lugar de consultar el tipo primero.
+                # unlink sobre un directorio da IsADirectoryError en Linux y
+                # PermissionError (EPERM) en macOS
+                try:
                     os.unlink(temp_path)
-                elif os.path.isdir(temp_path):
+                except (IsADirectoryError, PermissionError):
+                    if not os.path.isdir(temp_path):
+                        raise
                     shutil.rmtree(temp_path)
                 logger.debug(f"Archivo temporal eliminado: {temp_path}")
+            except FileNotFoundError:
+                pass
             except (OSError, PermissionError) as e:
                 logger.warning(f"No se pudo eliminar archivo temporal {temp_path}: {e}")
         
@@ -146,7 +153,7 @@ def temp_dir(prefix: str = "drcecim_", directory: Optional[str] = None, **kwargs
     Args:
         prefix: Prefijo para el directorio temporal
         directory: Directorio padre donde crear el directorio temporal
-        **kwargs: Argumentos adicionales para tempfile.mkdtemp
+        **kwargs: Argumentos adicionales para tempfile.TemporaryDirectory
         
     Yields:
         str: Ruta del directorio temporal
@@ -157,16 +164,16 @@ def temp_dir(prefix: str = "drcecim_", directory: Optional[str] = None, **kwargs
             pass
         # Directorio eliminado automáticamente
     """
-    temp_dir_path = None
+    # TemporaryDirectory borra el árbol completo al salir, aunque falle la
+    # creación de archivos dentro (en Cloud Functions /tmp ocupa memoria)
+    temp_directory = tempfile.TemporaryDirectory(prefix=prefix, dir=directory, **kwargs)
     try:
-        temp_dir_path = tempfile.mkdtemp(prefix=prefix, dir=directory, **kwargs)
-        yield temp_dir_path
+        yield temp_directory.name
     finally:
-        if temp_dir_path and os.path.exists(temp_dir_path):
-            try:
-                shutil.rmtree(temp_dir_path)
-            except (OSError, PermissionError) as e:
-                logger.warning(f"No se pudo eliminar directorio temporal {temp_dir_path}: {e}")
+        try:
+            temp_directory.cleanup()
+        except (OSError, PermissionError) as e:
+            logger.warning(f"No se pudo eliminar directorio temporal {temp_directory.name}: {e}")
 
 
 # Instancia global para uso directo
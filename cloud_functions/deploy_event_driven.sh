@@ -158,7 +158,7 @@ gcloud functions deploy process-pdf-to-chunks \
   --memory=32768MB \
   --timeout=1800s \
   --max-instances=5 \
-  --set-env-vars="GCS_BUCKET_NAME=${GCS_BUCKET_NAME},GCF_PROJECT_ID=${GCF_PROJECT_ID},OPENAI_API_KEY=${OPENAI_API_KEY},EMBEDDING_MODEL=${EMBEDDING_MODEL},API_TIMEOUT=${API_TIMEOUT},CHUNK_SIZE=${CHUNK_SIZE},CHUNK_OVERLAP=${CHUNK_OVERLAP},ENVIRONMENT=${ENVIRONMENT},LOG_LEVEL=${LOG_LEVEL},LOG_TO_DISK=false,DB_USER=${DB_USER},DB_PASS=${DB_PASS},DB_NAME=${DB_NAME},CLOUD_SQL_CONNECTION_NAME=${CLOUD_SQL_CONNECTION_NAME},DB_PRIVATE_IP=${DB_PRIVATE_IP}" \
+  --set-env-vars="GCS_BUCKET_NAME=${GCS_BUCKET_NAME},GCF_PROJECT_ID=${GCF_PROJECT_ID},OPENAI_API_KEY=${OPENAI_API_KEY},EMBEDDING_MODEL=${EMBEDDING_MODEL},API_TIMEOUT=${API_TIMEOUT},CHUNK_SIZE=${CHUNK_SIZE},CHUNK_OVERLAP=${CHUNK_OVERLAP},ENVIRONMENT=${ENVIRONMENT},LOG_LEVEL=${LOG_LEVEL},LOG_TO_DISK=false,DB_USER=${DB_USER},DB_PASS=${DB_PASS},DB_NAME=${DB_NAME},CLOUD_SQL_CONNECTION_NAME=${CLOUD_SQL_CONNECTION_NAME},DB_PRIVATE_IP=${DB_PRIVATE_IP},FUSED_PIPELINE=${FUSED_PIPELINE:-false}" \
   --project=${GCF_PROJECT_ID}
 
 if [[ $? -eq 0 ]]; then
@@ -5,35 +5,53 @@ en un único archivo para mejor organización y despliegue.
 """
 
 import os
+import gzip
+import io
 import json
 import logging
 import tempfile
 import psutil
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple, TYPE_CHECKING
 
 import functions_framework
-from google.cloud import storage
 
 # Importar configuración compartida
 from common.config import settings
 from common.config.logging_config import setup_logging, get_logger, StructuredLogger
-from common.services.embeddings_service import EmbeddingService
-from common.services.gcs_service import GCSService
-from common.services.status_service import StatusService, DocumentStatus
 # IndexManagerService eliminado - ahora usamos PostgreSQL directamente
 from common.services.processing_service import DocumentProcessor
-from common.utils.monitoring import get_logger as get_monitoring_logger, get_processing_monitor, log_system_info
+from common.utils.monitoring import (
+    get_logger as get_monitoring_logger, get_processing_monitor, log_system_info, flush_logs
+)
 from common.utils.temp_file_manager import temp_dir
 from common.utils.resource_managers import (
     document_processing_context,
     with_processing_resources,
-    error_handling_context
+    error_handling_context,
+    raise_if_cancelled
 )
-import openai
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+# Los clientes pesados (EmbeddingService con numpy, pyarrow, SQLAlchemy y
+# pgvector; openai; google-cloud-storage) se importan en el primer uso, no en
+# el cold start de cada función ni de los health checks
+if TYPE_CHECKING:
+    from common.services.embeddings_service import EmbeddingService
+    from common.services.gcs_service import GCSService
+    from common.services.status_service import StatusService
+
+# orjson decodifica directamente desde bytes y es bastante más rápido que json
+# con archivos de chunks grandes; si no está disponible se usa json (que
+# también acepta bytes)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
 
 # Configurar logging mejorado (sin file logging en Cloud Functions)
 setup_logging(log_level="INFO", enable_file_logging=False, enable_console_logging=True)
@@ -43,7 +61,8 @@ structured_logger = StructuredLogger("main")
 # Variables globales para pre-warm (cold-start optimization)
 _embedding_service = None
 _document_processor = None
-_gcs_service = None
+_gcs_services = {}
+_services_lock = threading.Lock()
 
 class MemoryMonitor:
     """Monitor de memoria en tiempo real para Cloud Functions."""
@@ -65,7 +84,7 @@ class MemoryMonitor:
         self.monitoring = True
         self.memory_samples = []
         
-        logger.info(f"🔍 Monitoreo de memoria iniciado - Memoria inicial: {self.start_memory:.1f} MB")
+        logger.debug(f"Monitoreo de memoria iniciado - Memoria inicial: {self.start_memory:.1f} MB")
         
         def monitor():
             while self.monitoring:
@@ -82,7 +101,7 @@ class MemoryMonitor:
         self.monitor_thread.start()
     
     def stop_monitoring(self):
-        """Detiene el monitoreo y reporta estadísticas."""
+        """Detiene el monitoreo y retorna estadísticas (el llamador las registra)."""
         self.monitoring = False
         if self.monitor_thread:
             self.monitor_thread.join(timeout=1)
@@ -90,23 +109,6 @@ class MemoryMonitor:
         final_memory = self.process.memory_info().rss / 1024 / 1024  # MB
         memory_increase = self.max_memory - self.start_memory
         
-        logger.info(f"📊 ESTADÍSTICAS DE MEMORIA:")
-        logger.info(f"   - Memoria inicial: {self.start_memory:.1f} MB")
-        logger.info(f"   - Memoria máxima: {self.max_memory:.1f} MB")
-        logger.info(f"   - Memoria final: {final_memory:.1f} MB")
-        logger.info(f"   - Incremento máximo: +{memory_increase:.1f} MB")
-        logger.info(f"   - Muestras tomadas: {len(self.memory_samples)}")
-        
-        # Log estructurado para métricas
-        structured_logger.info(
-            "Estadísticas de memoria completadas",
-            memoria_inicial_mb=round(self.start_memory, 1),
-            memoria_maxima_mb=round(self.max_memory, 1),
-            memoria_final_mb=round(final_memory, 1),
-            incremento_mb=round(memory_increase, 1),
-            muestras_totales=len(self.memory_samples)
-        )
-        
         return {
             'start_mb': self.start_memory,
             'max_mb': self.max_memory,
@@ -115,11 +117,20 @@ class MemoryMonitor:
             'samples': len(self.memory_samples)
         }
 
-def get_embedding_service() -> EmbeddingService:
-    """Obtiene una instancia global del servicio de embeddings."""
+def get_embedding_service() -> "EmbeddingService":
+    """
+    Obtiene una instancia global del servicio de embeddings.
+    
+    Se crea una sola vez por instancia: las invocaciones en caliente reutilizan
+    el cliente de OpenAI y el servicio de base de datos vectorial.
+    """
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        # Solo la inicialización se serializa (invocaciones concurrentes)
+        with _services_lock:
+            if _embedding_service is None:
+                from common.services.embeddings_service import EmbeddingService
+                _embedding_service = EmbeddingService()
     return _embedding_service
 
 def get_document_processor() -> DocumentProcessor:
@@ -129,16 +140,18 @@ def get_document_processor() -> DocumentProcessor:
         _document_processor = DocumentProcessor()
     return _document_processor
 
-def get_gcs_service() -> GCSService:
-    """Obtiene una instancia global del servicio de GCS."""
-    global _gcs_service
-    if _gcs_service is None:
-        from common.config.settings import GCS_BUCKET_NAME
-        _gcs_service = GCSService(GCS_BUCKET_NAME)
-    return _gcs_service
+def get_gcs_service(bucket_name: Optional[str] = None) -> "GCSService":
+    """Obtiene una instancia global del servicio de GCS (una por bucket)."""
+    from common.config.settings import GCS_BUCKET_NAME
+    bucket_name = bucket_name or GCS_BUCKET_NAME
+    gcs_service = _gcs_services.get(bucket_name)
+    if gcs_service is None:
+        from common.services.gcs_service import GCSService
+        gcs_service = _gcs_services.setdefault(bucket_name, GCSService(bucket_name))
+    return gcs_service
 
 # Configurar parámetros de procesamiento usando configuración centralizada
-from common.config.settings import CHUNK_SIZE, CHUNK_OVERLAP
+from common.config.settings import CHUNK_SIZE, CHUNK_OVERLAP, FUSED_PIPELINE
 
 # Inicializar monitoreo para create_embeddings
 app_logger = get_monitoring_logger("create_embeddings_function")
@@ -151,38 +164,149 @@ log_system_info()
 # FUNCIÓN 1: PROCESS_PDF_TO_CHUNKS
 # =============================================================================
 
-def is_pdf_file(file_name: str) -> bool:
-    """Verifica si el archivo es un PDF."""
-    return file_name.lower().endswith('.pdf')
+def _process_chunks_to_embeddings_direct(chunks_data: Dict, source_file: str) -> Dict:
+    """
+    Procesa chunks directamente a embeddings y PostgreSQL, sin almacenamiento
+    intermedio en GCS ni segunda invocación de create_embeddings_from_chunks.
+    
+    Args:
+        chunks_data (Dict): Datos de chunks del documento procesado
+        source_file (str): Ruta del PDF original en el bucket
+        
+    Returns:
+        Dict: Resultado del almacenamiento en PostgreSQL
+    """
+    from common.services.status_service import get_status_service
+    
+    session_id = processing_monitor.start_processing(source_file)
+    status_service = get_status_service()
+    
+    try:
+        # Mismos pasos y límites de recursos que _process_embeddings_pipeline,
+        # sin la descarga de chunks
+        with with_processing_resources(max_memory_mb=2048, timeout_seconds=900) as resources:
+            raise_if_cancelled(resources, "actualización de estado inicial")
+            document_id = _update_document_status_start(status_service, chunks_data)
+            
+            raise_if_cancelled(resources, "generación de embeddings")
+            embeddings_result = _generate_embeddings(chunks_data, session_id, document_id, status_service,
+                                                     cancel=resources['cancel'])
+            
+            raise_if_cancelled(resources, "verificación en PostgreSQL")
+            result = _manage_postgresql_embeddings(embeddings_result, session_id)
+            
+            raise_if_cancelled(resources, "actualización de estado final")
+            _update_document_status_completed(status_service, document_id, result)
+        
+        processing_monitor.finish_processing(session_id, success=True)
+        return result
+        
+    except Exception as e:
+        processing_monitor.finish_processing(session_id, success=False, error_message=str(e))
+        raise
+
 
+# Un hilo para preparar el pipeline fusionado mientras el PDF se descarga y
+# pasa por Marker (red y subproceso: el proceso principal queda ocioso)
+_warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fused_warmup")
 
-# FUNCIÓN DE OPTIMIZACIÓN TEMPORAL - COMENTADA PARA DEPLOYMENT INICIAL
-# def _process_chunks_to_embeddings_direct(chunks_data: Dict, source_file: str) -> Dict:
-#     """
-#     OPTIMIZACIÓN FUTURA: Procesa chunks directamente a embeddings y PostgreSQL
-#     sin almacenamiento intermedio en GCS. Comentada temporalmente para deployment.
-#     """
-#     pass
+
+def _start_fused_warmup() -> Future:
+    """
+    Inicializa en segundo plano lo que el pipeline fusionado usa después del
+    procesamiento: EmbeddingService (imports pesados, cliente de OpenAI y
+    motor de PostgreSQL) y el servicio de estado.
+    
+    El document_id no se busca acá: la UI registra el documento después de
+    subir el PDF, y al resolverlo en el evento de subida una recarga del
+    mismo archivo encontraría el id anterior.
+    
+    Returns:
+        Future: Tarea en segundo plano
+    """
+    def warmup():
+        from common.services.status_service import get_status_service
+        get_embedding_service()
+        get_status_service()
+    
+    return _warmup_executor.submit(warmup)
+
+
+def _wait_for_warmup(warmup: Future) -> None:
+    """Espera la preparación en segundo plano; sus errores no interrumpen el flujo."""
+    try:
+        warmup.result()
+    except Exception as e:
+        # El paso real vuelve a intentar la inicialización y reporta el error
+        logger.warning(f"No se pudo preparar el pipeline fusionado: {str(e)}")
+
+
+def _elapsed_ms(start_ns: int) -> Tuple[float, int]:
+    """
+    Calcula los milisegundos transcurridos desde start_ns.
+    
+    Returns:
+        Tuple[float, int]: Duración en ms y marca de tiempo actual (inicio de la siguiente fase)
+    """
+    now = time.perf_counter_ns()
+    return round((now - start_ns) / 1e6, 1), now
+
+
+# A partir de este tamaño el PDF se descarga por rangos en paralelo
+PARALLEL_DOWNLOAD_MIN_BYTES = 32 * 1024 * 1024
+PARALLEL_DOWNLOAD_CHUNK_BYTES = 16 * 1024 * 1024
+PARALLEL_DOWNLOAD_WORKERS = 8
+
+
+def _download_blob_to_file(blob, local_path: str, size: Any = None):
+    """
+    Descarga un blob a disco; los archivos grandes se bajan en rangos paralelos.
+    
+    Args:
+        blob: Blob de GCS a descargar
+        local_path (str): Ruta local de destino
+        size: Tamaño informado por el evento de Storage (puede venir como str)
+    """
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        size = 0
+    
+    if size < PARALLEL_DOWNLOAD_MIN_BYTES:
+        # Los PDFs vienen del bucket interno (solo los sube la UI de carga) y
+        # se guardan sin Content-Encoding: se bajan tal cual y sin recalcular
+        # el checksum en la instancia (un PDF corrupto igual falla en Marker)
+        blob.download_to_filename(local_path, raw_download=True, checksum=None)
+        return
+    
+    # Un único stream HTTP no satura la red de la instancia: varias
+    # peticiones por rango (hilos, sin procesos extra) se escriben en su offset
+    from google.cloud.storage import transfer_manager
+    if blob.size is None:
+        blob.reload()
+    transfer_manager.download_chunks_concurrently(
+        blob,
+        local_path,
+        chunk_size=PARALLEL_DOWNLOAD_CHUNK_BYTES,
+        max_workers=PARALLEL_DOWNLOAD_WORKERS,
+        worker_type=transfer_manager.THREAD
+    )
 
 
 def process_pdf_document(pdf_path: str, filename: str) -> Dict:
     """Procesa un documento PDF completo usando DocumentProcessor."""
     try:
-        structured_logger.info("Iniciando procesamiento de documento PDF", 
-            filename=filename,
-            pdf_path=pdf_path,
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
-        )
-        
-        # Usar DocumentProcessor del processing_service
-        processor = DocumentProcessor()
-        result = processor.process_document_complete(pdf_path)
+        # Usar el DocumentProcessor global (se reutiliza entre invocaciones); la
+        # salida intermedia de Marker va al directorio temporal de la invocación
+        pdf_file = Path(pdf_path)
+        processor = get_document_processor()
+        result = processor.process_document_complete(pdf_path, work_dir=str(pdf_file.parent))
         
         if not result.get('processed_successfully', False):
+            error = result.get('error', 'Error desconocido')
             structured_logger.error("Error en procesamiento de PDF con DocumentProcessor", 
                 filename=filename,
-                error=result.get('error', 'Error desconocido')
+                error=error
             )
             return {
                 'filename': filename,
@@ -190,41 +314,44 @@ def process_pdf_document(pdf_path: str, filename: str) -> Dict:
                 'num_chunks': 0,
                 'total_words': 0,
                 'processed_successfully': False,
-                'error': result.get('error', 'Error desconocido')
+                'error': error
             }
         
-        # Adaptar el formato de chunks al formato esperado por el resto del código
-        adapted_chunks = []
-        for i, chunk_text in enumerate(result.get('chunks', [])):
-            adapted_chunks.append({
+        # Adaptar el formato de chunks al formato esperado por el resto del código.
+        # Los offsets salen de un cursor con el conteo real de palabras de cada
+        # chunk (una sola división por chunk), no de i * CHUNK_SIZE. Los campos
+        # del resultado se leen una sola vez, fuera del bucle
+        chunks = result.get('chunks') or []
+        total_words = result.get('total_words', 0)
+        markdown_len = len(result.get('markdown_content') or '')
+        num_chunks = len(chunks)
+        adapted_chunks = [None] * num_chunks
+        cursor = 0
+        for i, chunk_text in enumerate(chunks):
+            word_count = len(chunk_text.split())
+            adapted_chunks[i] = {
                 'text': chunk_text,
-                'start_word': i * CHUNK_SIZE,  # Aproximación
-                'end_word': (i + 1) * CHUNK_SIZE,
-                'word_count': len(chunk_text.split())
-            })
+                'start_word': cursor,
+                'end_word': cursor + word_count,
+                'word_count': word_count
+            }
+            cursor += word_count
         
         # Preparar resultado adaptado
         adapted_result = {
             'filename': filename,
             'chunks': adapted_chunks,
-            'num_chunks': len(adapted_chunks),
-            'total_words': result.get('total_words', 0),
-            'processing_timestamp': str(Path(pdf_path).stat().st_mtime),
+            'num_chunks': num_chunks,
+            'total_words': total_words,
+            'processing_timestamp': str(pdf_file.stat().st_mtime),
             'processed_successfully': True,
             'metadata': {
                 'chunk_size': CHUNK_SIZE,
                 'chunk_overlap': CHUNK_OVERLAP,
-                'total_text_length': len(result.get('markdown_content', '')),
+                'total_text_length': markdown_len,
                 'processing_method': 'markdown_enhanced'
             }
         }
-        
-        structured_logger.info("PDF procesado exitosamente con DocumentProcessor", 
-            filename=filename,
-            num_chunks=len(adapted_chunks),
-            total_words=result.get('total_words', 0),
-            processing_method='markdown_enhanced'
-        )
         return adapted_result
         
     except Exception as e:
@@ -272,18 +399,21 @@ def process_pdf_to_chunks(cloud_event: Any) -> None:
             not file_name.lower().endswith(".pdf")):
             return "ignored", 204
         
-        # Debug: Log completo del evento
-        structured_logger.info("Evento completo recibido", 
-            cloud_event_type=getattr(cloud_event, 'type', 'unknown'),
-            cloud_event_data=str(event_data),
-            bucket_name=bucket_name,
-            file_name=file_name,
-            event_type=event_type
-        )
+        # Nombre base y stem calculados una vez (ya se sabe que termina en .pdf)
+        base_name = file_name.rsplit('/', 1)[-1]
+        stem = base_name[:-len('.pdf')]
+        
+        # Tiempos de cada fase: se registran en un único log al final
+        spans = {}
+        phase_start = time.perf_counter_ns()
+        
+        # En el pipeline fusionado, la inicialización de los servicios de
+        # embeddings y de estado se solapa con la descarga y el parseo del PDF
+        warmup = _start_fused_warmup() if FUSED_PIPELINE else None
                 
-        # Inicializar cliente de Storage
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
+        # Cliente de Storage compartido entre invocaciones
+        from common.services.gcs_service import get_storage_client
+        bucket = get_storage_client().bucket(bucket_name)
         blob = bucket.blob(file_name)
         
         # Inicializar monitor de memoria
@@ -295,74 +425,88 @@ def process_pdf_to_chunks(cloud_event: Any) -> None:
             with error_handling_context() as error_context:
                 # Crear directorio temporal usando TempFileManager
                 with temp_dir(prefix="drcecim_pdf_") as temp_dir_path:
-                    temp_file_path = Path(temp_dir_path) / Path(file_name).name
+                    temp_file_path = Path(temp_dir_path) / base_name
                     
                     # Descargar archivo PDF
-                    structured_logger.info("Iniciando descarga de PDF", 
-                        file_name=file_name,
-                        temp_path=str(temp_file_path)
-                    )
-                    blob.download_to_filename(str(temp_file_path))
+                    _download_blob_to_file(blob, str(temp_file_path), event_data.get('size'))
+                    spans['download_ms'], phase_start = _elapsed_ms(phase_start)
                     
                     # Procesar PDF
-                    structured_logger.info("Iniciando procesamiento de PDF", 
+                    result = process_pdf_document(str(temp_file_path), file_name)
+                    spans['process_ms'], phase_start = _elapsed_ms(phase_start)
+                
+                # Al salir del directorio temporal se borra el PDF descargado
+                # (en /tmp, que ocupa memoria) antes de serializar y subir los
+                # chunks, en lugar de mantenerlo hasta el final de la subida
+                if not result.get('processed_successfully', False):
+                    memory_monitor.stop_monitoring()
+                    structured_logger.error("Error en procesamiento de PDF", 
                         file_name=file_name,
-                        chunk_size=CHUNK_SIZE,
-                        chunk_overlap=CHUNK_OVERLAP
+                        error=result.get('error', 'Error desconocido'),
+                        **spans
                     )
-                    result = process_pdf_document(str(temp_file_path), file_name)
-                    
-                    if not result.get('processed_successfully', False):
-                        structured_logger.error("Error en procesamiento de PDF", 
-                            file_name=file_name,
-                            error=result.get('error', 'Error desconocido')
-                        )
-                        return
-                    
-                    # Preparar datos para subir
-                    chunks_data = {
-                        'filename': result['filename'],
-                        'chunks': result['chunks'],
-                        'metadata': result['metadata'],
-                        'num_chunks': result['num_chunks'],
-                        'total_words': result['total_words'],
-                        'processing_timestamp': result['processing_timestamp'],
-                        'source_file': file_name,
-                        'processed_successfully': True
-                    }
-                    
-                    # Subir chunks procesados (mantenemos el comportamiento original por ahora)
-                    chunks_filename = f"{Path(file_name).stem}_chunks.json"
+                    return
+                
+                # Preparar datos para subir
+                chunks_data = {
+                    'filename': result['filename'],
+                    'chunks': result['chunks'],
+                    'metadata': result['metadata'],
+                    'num_chunks': result['num_chunks'],
+                    'total_words': result['total_words'],
+                    'processing_timestamp': result['processing_timestamp'],
+                    'source_file': file_name,
+                    'processed_successfully': True
+                }
+                
+                if FUSED_PIPELINE:
+                    # Pipeline fusionado: los chunks siguen en memoria, así que
+                    # se evita la escritura y relectura en GCS y el cold start
+                    # de la segunda función
+                    chunks_gcs_path = None
+                    _wait_for_warmup(warmup)
+                    _process_chunks_to_embeddings_direct(chunks_data, file_name)
+                    spans['embeddings_ms'], phase_start = _elapsed_ms(phase_start)
+                else:
+                    # Flujo en dos etapas: subir chunks para create_embeddings_from_chunks
+                    chunks_filename = f"{stem}{CHUNKS_FILE_SUFFIX}"
                     chunks_gcs_path = f"processed/{chunks_filename}"
                     
-                    structured_logger.info("Subiendo chunks procesados", 
-                        file_name=file_name,
-                        chunks_path=chunks_gcs_path,
-                        num_chunks=result['num_chunks'],
-                        total_words=result['total_words']
-                    )
+                    # JSON compacto: el artefacto solo lo lee la función de
+                    # embeddings, y la indentación agregaba bytes a subir,
+                    # almacenar y volver a descargar. Además va comprimido con
+                    # gzip (nivel 1: el texto se reduce varias veces con muy poco
+                    # CPU), así que viaja menos dos veces por la red
                     chunks_blob = bucket.blob(chunks_gcs_path)
-                    chunks_blob.upload_from_string(
-                        json.dumps(chunks_data, ensure_ascii=False, indent=2),
-                        content_type='application/json'
-                    )
-                    
-                    structured_logger.info("PDF procesado exitosamente", 
-                        file_name=file_name,
-                        chunks_path=chunks_gcs_path,
-                        num_chunks=result['num_chunks'],
-                        processing_time='completed'
-                    )
+                    chunks_blob.content_encoding = 'gzip'
+                    if orjson is not None:
+                        # orjson serializa en C directo a bytes UTF-8 (compacto y
+                        # sin escapar acentos): una sola copia y una sola petición
+                        chunks_blob.upload_from_string(
+                            gzip.compress(orjson.dumps(chunks_data, option=orjson.OPT_NON_STR_KEYS),
+                                          compresslevel=1),
+                            content_type='application/json'
+                        )
+                    else:
+                        # Sin orjson se serializa directo al stream de subida, sin
+                        # armar el str completo y su copia codificada en memoria
+                        with chunks_blob.open("wb", ignore_flush=True, content_type='application/json') as raw_file, \
+                                gzip.GzipFile(fileobj=raw_file, mode="wb", compresslevel=1) as gzip_file, \
+                                io.TextIOWrapper(gzip_file, encoding="utf-8") as chunks_file:
+                            json.dump(chunks_data, chunks_file, ensure_ascii=False, separators=(',', ':'))
+                    spans['upload_ms'], phase_start = _elapsed_ms(phase_start)
         
-        # Detener monitoreo de memoria y reportar estadísticas
-        if 'memory_monitor' in locals():
-            memory_stats = memory_monitor.stop_monitoring()
-            structured_logger.info("PDF procesado con éxito - Estadísticas finales",
-                memoria_maxima_usada_mb=memory_stats['max_mb'],
-                memoria_disponible_mb=32768,  # 32GB asignados
-                porcentaje_usado=round((memory_stats['max_mb'] / 32768) * 100, 1),
-                archivo_procesado=file_name
-            )
+        # Un solo log estructurado por PDF con tiempos, resultado y memoria
+        memory_stats = memory_monitor.stop_monitoring()
+        structured_logger.info("PDF procesado exitosamente",
+            file_name=file_name,
+            chunks_path=chunks_gcs_path,
+            num_chunks=result['num_chunks'],
+            total_words=result['total_words'],
+            memoria_maxima_usada_mb=round(memory_stats['max_mb'], 1),
+            porcentaje_usado=round((memory_stats['max_mb'] / 32768) * 100, 1),  # 32GB asignados
+            **spans
+        )
     
     except Exception as e:
         # Detener monitoreo de memoria en caso de error
@@ -380,12 +524,22 @@ def process_pdf_to_chunks(cloud_event: Any) -> None:
                 file_name=file_name if 'file_name' in locals() else 'unknown'
             )
         raise
+    
+    finally:
+        # Escribir los logs encolados antes de responder
+        flush_logs()
 
 
 # =============================================================================
 # FUNCIÓN 2: CREATE_EMBEDDINGS_FROM_CHUNKS
 # =============================================================================
 
+CHUNKS_FILE_SUFFIX = '_chunks.json'
+
+# Cabecera de un stream gzip (un JSON nunca empieza con estos bytes)
+GZIP_MAGIC = b'\x1f\x8b'
+
+
 def is_chunks_file(file_name: str) -> bool:
     """
     Verifica si el archivo es un archivo de chunks procesados.
@@ -396,10 +550,11 @@ def is_chunks_file(file_name: str) -> bool:
     Returns:
         bool: True si es un archivo de chunks
     """
-    return file_name.lower().endswith('_chunks.json')
+    # Solo se normaliza el sufijo, no el nombre completo
+    return file_name[-len(CHUNKS_FILE_SUFFIX):].lower() == CHUNKS_FILE_SUFFIX
 
 
-def find_document_id_from_status(status_service: StatusService, filename: str) -> str:
+def find_document_id_from_status(status_service: "StatusService", filename: str) -> str:
     """
     Busca el document_id basado en el nombre del archivo original.
     
@@ -413,35 +568,34 @@ def find_document_id_from_status(status_service: StatusService, filename: str) -
     try:
         if not filename:
             return None
-            
-        # Buscar documentos que coincidan con el nombre del archivo
-        all_docs = status_service.get_all_documents(limit=50)
-        for doc in all_docs:
-            if doc.get('filename') == filename:
-                return doc.get('document_id')
-        return None
+        
+        # Búsqueda por prefijo del nombre del archivo (sin descargar otros
+        # estados). No se cachea: una recarga del mismo archivo registra un
+        # document_id nuevo
+        return status_service.find_document_id_by_filename(filename)
     except Exception as e:
         app_logger.error(f"Error al buscar document_id: {str(e)}")
         return None
 
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type((openai.APITimeoutError, openai.RateLimitError))
-)
-def generate_embeddings_with_retry(embedding_service: EmbeddingService, chunks_data: Dict) -> Dict:
+def generate_embeddings_with_retry(embedding_service: "EmbeddingService", chunks_data: Dict,
+                                   cancel: Optional[threading.Event] = None) -> Dict:
     """
     Genera embeddings con reintentos para errores de red.
     
+    Los reintentos se aplican a cada batch dentro de EmbeddingService (en
+    paralelo): un batch que falla no vuelve a enviar el documento completo.
+    
     Args:
         embedding_service (EmbeddingService): Servicio de embeddings
         chunks_data (Dict): Datos de chunks
+        cancel (Optional[threading.Event]): Evento de cancelación de
+            with_processing_resources
         
     Returns:
         Dict: Resultado del procesamiento de embeddings
     """
-    return embedding_service.process_document_embeddings(chunks_data)
+    return embedding_service.process_document_embeddings(chunks_data, cancel=cancel)
 
 
 @functions_framework.cloud_event
@@ -485,6 +639,10 @@ def create_embeddings_from_chunks(cloud_event):
     except Exception as e:
         logger.error(f"Error en create_embeddings_from_chunks: {str(e)}")
         raise
+    
+    finally:
+        # Escribir los logs encolados antes de responder
+        flush_logs()
 
 
 def _validate_cloud_event(cloud_event) -> bool:
@@ -533,49 +691,63 @@ def _process_embeddings_pipeline(bucket_name: str, file_name: str, session_id: s
     Returns:
         Dict[str, Any]: Resultado del procesamiento
     """
-    # Inicializar servicios
-    gcs_service = GCSService(bucket_name=bucket_name)
-    status_service = StatusService()
+    from common.services.status_service import get_status_service
+    
+    # Servicios globales: las invocaciones en caliente reutilizan sus clientes
+    gcs_service = get_gcs_service(bucket_name)
+    status_service = get_status_service()
     
     # Usar context managers para robustez y límites de recursos
     with with_processing_resources(max_memory_mb=2048, timeout_seconds=900) as resources:
         with error_handling_context() as error_context:
-            with temp_dir(prefix='drcecim_embeddings_') as temp_dir_path:
-                try:
-                    # 1. Descargar y cargar chunks
-                    chunks_data = _download_and_load_chunks(gcs_service, file_name, session_id)
-                    
-                    # 2. Buscar document_id y actualizar estado
-                    document_id = _update_document_status_start(status_service, chunks_data)
-                    
-                    # 3. Generar embeddings
-                    embeddings_result = _generate_embeddings(chunks_data, temp_dir_path, session_id, document_id, status_service)
-                    
-                    # 4. Gestionar almacenamiento en PostgreSQL
-                    result = _manage_postgresql_embeddings(embeddings_result, session_id)
-                    
-                    # 5. Actualizar estado final
-                    _update_document_status_completed(status_service, document_id, result)
-                    
-                    return result
-                    
-                except Exception as e:
-                    structured_logger.error("Error en pipeline de embeddings", 
-                        session_id=session_id,
-                        file_name=file_name,
-                        error=str(e),
-                        error_type=type(e).__name__
-                    )
-                    raise
+            try:
+                # Fuera del hilo principal el timeout y el límite de memoria
+                # solo marcan resources['cancel']: se revisa entre cada paso
+                # 1. Descargar y cargar chunks
+                chunks_data = _download_and_load_chunks(gcs_service, file_name, session_id)
+                
+                # 2. Buscar document_id y actualizar estado
+                raise_if_cancelled(resources, "actualización de estado inicial")
+                document_id = _update_document_status_start(status_service, chunks_data)
+                
+                # 3. Generar y almacenar embeddings (los batches pendientes se
+                # omiten si se pide la cancelación)
+                raise_if_cancelled(resources, "generación de embeddings")
+                embeddings_result = _generate_embeddings(chunks_data, session_id, document_id, status_service,
+                                                         cancel=resources['cancel'])
+                
+                # 4. Gestionar almacenamiento en PostgreSQL
+                raise_if_cancelled(resources, "verificación en PostgreSQL")
+                result = _manage_postgresql_embeddings(embeddings_result, session_id)
+                
+                # 5. Actualizar estado final
+                raise_if_cancelled(resources, "actualización de estado final")
+                _update_document_status_completed(status_service, document_id, result)
+                
+                return result
+                
+            except Exception as e:
+                structured_logger.error("Error en pipeline de embeddings", 
+                    session_id=session_id,
+                    file_name=file_name,
+                    error=str(e),
+                    error_type=type(e).__name__
+                )
+                raise
 
 
-def _download_and_load_chunks(gcs_service: GCSService, file_name: str, session_id: str) -> Dict:
+def _download_and_load_chunks(gcs_service: "GCSService", file_name: str, session_id: str) -> Dict:
     """
     Descarga y carga los datos de chunks desde GCS.
     """
     app_logger.info("Descargando archivo de chunks", {'session_id': session_id})
-    chunks_content = gcs_service.read_file_as_string(file_name)
-    chunks_data = json.loads(chunks_content)
+    chunks_bytes = gcs_service.read_file_as_bytes(file_name)
+    # Los artefactos se suben con Content-Encoding gzip; si la descarga no los
+    # descomprimió (transcodificación de GCS), se descomprimen acá
+    if chunks_bytes[:2] == GZIP_MAGIC:
+        chunks_bytes = gzip.decompress(chunks_bytes)
+    # Parsear los bytes descargados sin pasar por un str intermedio
+    chunks_data = _json_loads(chunks_bytes)
     
     # Agregar la ruta del archivo de chunks para limpieza posterior
     chunks_data['chunks_file_path'] = f"gs://{gcs_service.bucket_name}/{file_name}"
@@ -587,10 +759,12 @@ def _download_and_load_chunks(gcs_service: GCSService, file_name: str, session_i
     return chunks_data
 
 
-def _update_document_status_start(status_service: StatusService, chunks_data: Dict) -> str:
+def _update_document_status_start(status_service: "StatusService", chunks_data: Dict) -> str:
     """
     Busca el document_id y actualiza el estado inicial.
     """
+    from common.services.status_service import DocumentStatus
+    
     original_filename = chunks_data.get('filename', '')
     document_id = find_document_id_from_status(status_service, original_filename)
     
@@ -605,16 +779,19 @@ def _update_document_status_start(status_service: StatusService, chunks_data: Di
     return document_id
 
 
-def _generate_embeddings(chunks_data: Dict, temp_dir: str, session_id: str, 
-                        document_id: str, status_service: StatusService) -> Dict:
+def _generate_embeddings(chunks_data: Dict, session_id: str, 
+                        document_id: str, status_service: "StatusService",
+                        cancel: Optional[threading.Event] = None) -> Dict:
     """
     Genera embeddings con manejo de errores robusto.
     """
+    from common.services.status_service import DocumentStatus
+    
     app_logger.info("Generando embeddings", {'session_id': session_id})
     processing_monitor.log_step(session_id, "embeddings_generation_started")
     
-    embedding_service = EmbeddingService(temp_dir)
-    embeddings_result = generate_embeddings_with_retry(embedding_service, chunks_data)
+    embedding_service = get_embedding_service()
+    embeddings_result = generate_embeddings_with_retry(embedding_service, chunks_data, cancel)
     
     if not embeddings_result.get('processed_successfully', False):
         error_msg = embeddings_result.get('error', 'Error en generación de embeddings')
@@ -651,27 +828,16 @@ def _manage_postgresql_embeddings(embeddings_result: Dict, session_id: str) -> D
     """
     Gestiona el almacenamiento de embeddings en PostgreSQL.
     """
-    from common.services.vector_db_service import VectorDBService
-    
     try:
-        # Inicializar servicio de base de datos vectorial
-        vector_db = VectorDBService()
+        # Reutilizar el servicio vectorial del EmbeddingService global: la
+        # configuración del índice ya leída sigue en memoria entre invocaciones
+        vector_db = get_embedding_service().vector_db
         
-        # Eliminar embeddings viejos del mismo documento si existen
-        document_id = embeddings_result.get('config', {}).get('filename', '').replace('.pdf', '')
-        if document_id:
-            app_logger.info(f"Eliminando embeddings viejos del documento: {document_id}", {'session_id': session_id})
-            removed_success = vector_db.delete_document_embeddings(document_id)
-            
-            processing_monitor.log_step(session_id, "old_embeddings_removed", {
-                'document_id': document_id,
-                'removal_success': removed_success
-            })
-        
-        # Los embeddings ya fueron almacenados en PostgreSQL por el EmbeddingService
-        # Solo necesitamos obtener estadísticas
+        # Los embeddings ya fueron almacenados en PostgreSQL por el EmbeddingService,
+        # que reemplaza en la misma transacción los chunks previos del documento.
+        # Solo necesitamos los totales (una consulta por evento)
         app_logger.info("Verificando almacenamiento en PostgreSQL", {'session_id': session_id})
-        stats = vector_db.get_database_stats()
+        stats = vector_db.get_embedding_totals()
         
         processing_monitor.log_step(session_id, "postgresql_verified", {
             'total_embeddings': stats.get('total_embeddings', 0),
@@ -689,10 +855,12 @@ def _manage_postgresql_embeddings(embeddings_result: Dict, session_id: str) -> D
         raise
 
 
-def _update_document_status_completed(status_service: StatusService, document_id: str, result: Dict):
+def _update_document_status_completed(status_service: "StatusService", document_id: str, result: Dict):
     """
     Actualiza el estado final del documento.
     """
+    from common.services.status_service import DocumentStatus
+    
     if document_id:
         status_service.update_status(
             document_id, 
@@ -701,7 +869,7 @@ def _update_document_status_completed(status_service: StatusService, document_id
             "embeddings_completed",
             metadata={
                 'total_vectors': result['total_vectors'],
-                'uploaded_files': result['uploaded_files']
+                'unique_documents': result['unique_documents']
             }
         )
 
@@ -710,24 +878,34 @@ def _update_document_status_completed(status_service: StatusService, document_id
 # HEALTH CHECKS
 # =============================================================================
 
+# Las respuestas de health check son constantes: se serializan una sola vez al
+# cargar el módulo y cada petición solo devuelve los bytes ya armados
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def _health_body(function_name: str) -> str:
+    """Serializa la respuesta de health check de una función."""
+    return json.dumps({
+        'status': 'healthy',
+        'function': function_name,
+        'version': '1.0.0'
+    })
+
+
+_HEALTH_PROCESS_PDF_BODY = _health_body('process_pdf_to_chunks')
+_HEALTH_CREATE_EMBEDDINGS_BODY = _health_body('create_embeddings_from_chunks')
+
+
 @functions_framework.http
 def health_check_process_pdf(request):
     """Endpoint de health check para la función process_pdf_to_chunks."""
-    return {
-        'status': 'healthy',
-        'function': 'process_pdf_to_chunks',
-        'version': '1.0.0'
-    }
+    return _HEALTH_PROCESS_PDF_BODY, 200, JSON_HEADERS
 
 
 @functions_framework.http
 def health_check_create_embeddings(request):
     """Endpoint de health check para la función create_embeddings_from_chunks."""
-    return {
-        'status': 'healthy',
-        'function': 'create_embeddings_from_chunks',
-        'version': '1.0.0'
-    }
+    return _HEALTH_CREATE_EMBEDDINGS_BODY, 200, JSON_HEADERS
 
 
 if __name__ == '__main__':
@@ -5,16 +5,29 @@
 -- 1. Crear extensión pgvector
 CREATE EXTENSION IF NOT EXISTS vector;
 
--- 2. Crear tabla de embeddings
+-- 2. Crear tabla de embeddings particionada por document_id
+-- (los borrados y búsquedas filtradas por documento solo leen una partición)
 CREATE TABLE IF NOT EXISTS embeddings (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     document_id TEXT NOT NULL,
     chunk_id TEXT NOT NULL,
     text_content TEXT NOT NULL,
     embedding_vector vector(1536) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, document_id)
+) PARTITION BY HASH (document_id);
+
+-- Particiones hash (16)
+DO $$
+BEGIN
+    FOR i IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS embeddings_p%s PARTITION OF embeddings FOR VALUES WITH (MODULUS 16, REMAINDER %s);',
+            i, i
+        );
+    END LOOP;
+END $$;
 
 -- 3. Crear tabla de documentos (opcional)
 CREATE TABLE IF NOT EXISTS documents (
@@ -37,8 +50,20 @@ CREATE TABLE IF NOT EXISTS documents (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 3b. Crear caché de embeddings por contenido (compartido entre documentos)
+-- content_hash = SHA-256(modelo + "\0" + texto); ver EmbeddingCacheModel
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    content_hash BYTEA PRIMARY KEY,
+    model VARCHAR(100) NOT NULL,
+    embedding_vector vector(1536) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- 4. Crear índices para optimizar búsquedas
--- Índice para búsquedas de similitud vectorial (coseno)
+-- Los índices creados sobre la tabla padre se propagan a cada partición
+-- Índice para búsquedas de similitud vectorial (coseno). VectorDBService.create_index
+-- lo reemplaza por HNSW si pgvector >= 0.5.0, o lo recrea con lists ~ 4*sqrt(N/16)
+-- (filas por partición) cuando el corpus cambia de escala
 CREATE INDEX IF NOT EXISTS idx_embeddings_vector_cosine 
 ON embeddings USING ivfflat (embedding_vector vector_cosine_ops) 
 WITH (lists = 100);
@@ -56,6 +81,7 @@ CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(processing_status);
 -- 5. Conceder permisos al usuario raguser
 GRANT ALL PRIVILEGES ON TABLE embeddings TO raguser;
 GRANT ALL PRIVILEGES ON TABLE documents TO raguser;
+GRANT ALL PRIVILEGES ON TABLE embedding_cache TO raguser;
 GRANT USAGE, SELECT ON SEQUENCE embeddings_id_seq TO raguser;
 GRANT USAGE, SELECT ON SEQUENCE documents_id_seq TO raguser;
 
@@ -82,4 +108,12 @@ SELECT
         WHEN EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'documents') 
         THEN 'CREATED' 
         ELSE 'NOT CREATED' 
+    END as status;
+
+SELECT 
+    'embedding_cache table' as component,
+    CASE 
+        WHEN EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'embedding_cache') 
+        THEN 'CREATED' 
+        ELSE 'NOT CREATED' 
     END as status; 
\ No newline at end of file
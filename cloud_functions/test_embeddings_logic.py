@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Pruebas unitarias de la lógica pura del pipeline de embeddings.
+
+No requieren GCP, OpenAI ni PostgreSQL: los servicios se crean sin pasar por
+su __init__ y sus dependencias externas se reemplazan por dobles.
+
+Cubren:
+- Armado de batches por cantidad de textos y caracteres (_pack_batches)
+- Orden y deduplicación al combinar embeddings almacenados, del caché y de la API
+- Selección del document_id más reciente por prefijo (find_document_id_by_filename)
+
+Ejecutar con: python -m pytest test_embeddings_logic.py
+"""
+
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+
+# Agregar el directorio actual al path para importaciones
+sys.path.insert(0, str(Path(__file__).parent))
+
+# settings.py exige estas variables al importarse; ninguna prueba las usa
+for _name, _value in (('OPENAI_API_KEY', 'sk-test'), ('GCS_BUCKET_NAME', 'test-bucket'),
+                      ('GCF_PROJECT_ID', 'test-project')):
+    os.environ.setdefault(_name, _value)
+
+from common.services.embeddings_service import EmbeddingService, content_hash
+from common.services.status_service import StatusService
+from common.config.settings import EMBEDDING_MODEL
+
+
+def _vector(text: str) -> np.ndarray:
+    """Embedding determinístico de prueba: identifica al texto por su contenido."""
+    return np.array([len(text), sum(map(ord, text)) % 997], dtype=np.float32)
+
+
+def _embedding_service(stored=None, cached=None) -> EmbeddingService:
+    """
+    Crea un EmbeddingService sin cliente de OpenAI ni base de datos.
+
+    Args:
+        stored: Embeddings ya almacenados del documento (texto -> vector)
+        cached: Embeddings del caché por contenido (hash -> vector)
+    """
+    service = EmbeddingService.__new__(EmbeddingService)
+    service.vector_db = MagicMock()
+    service.vector_db.get_stored_embeddings.return_value = stored or {}
+    service.vector_db.get_cached_embeddings.side_effect = (
+        lambda hashes, model: {h: v for h, v in (cached or {}).items() if h in hashes}
+    )
+    service.api_calls = []
+
+    def generate_embeddings(texts, cancel=None, **kwargs):
+        service.api_calls.append(list(texts))
+        return np.vstack([_vector(text) for text in texts])
+
+    service.generate_embeddings = generate_embeddings
+    return service
+
+
+# ========================
+# _pack_batches
+# ========================
+
+def test_pack_batches_empty():
+    assert EmbeddingService._pack_batches([], max_inputs=10, max_chars=100) == []
+
+
+def test_pack_batches_respects_max_inputs():
+    texts = ["a"] * 7
+    assert EmbeddingService._pack_batches(texts, max_inputs=3, max_chars=1000) == [(0, 3), (3, 6), (6, 7)]
+
+
+def test_pack_batches_respects_max_chars():
+    texts = ["x" * 40, "x" * 40, "x" * 40, "x" * 10]
+    # 40 + 40 = 80 entra; sumar otro texto de 40 supera 100
+    assert EmbeddingService._pack_batches(texts, max_inputs=10, max_chars=100) == [(0, 2), (2, 4)]
+
+
+def test_pack_batches_oversized_text_goes_alone():
+    texts = ["x" * 10, "x" * 500, "x" * 10]
+    assert EmbeddingService._pack_batches(texts, max_inputs=10, max_chars=100) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_pack_batches_covers_all_texts_in_order():
+    texts = ["x" * (i % 37 + 1) for i in range(1000)]
+    batches = EmbeddingService._pack_batches(texts, max_inputs=64, max_chars=500)
+    assert batches[0][0] == 0
+    assert batches[-1][1] == len(texts)
+    for (_, end), (start, _) in zip(batches, batches[1:]):
+        assert end == start
+    for start, end in batches:
+        assert end - start <= 64
+        assert end - start == 1 or sum(len(t) for t in texts[start:end]) <= 500
+
+
+# ========================
+# Deduplicación y combinación de embeddings
+# ========================
+
+def test_document_embeddings_embeds_repeated_texts_once():
+    service = _embedding_service()
+    texts = ["encabezado", "uno", "encabezado", "dos", "uno"]
+
+    embeddings = service.generate_document_embeddings(texts, "doc")
+
+    assert service.api_calls == [["encabezado", "uno", "dos"]]
+    np.testing.assert_array_equal(embeddings, np.vstack([_vector(t) for t in texts]))
+
+
+def test_unique_embeddings_merge_stored_cache_and_api_in_order():
+    texts = ["almacenado", "en caché", "nuevo 1", "nuevo 2"]
+    stored = {"almacenado": _vector("almacenado")}
+    cached = {content_hash("en caché"): _vector("en caché")}
+    service = _embedding_service(stored=stored, cached=cached)
+
+    embeddings = service._generate_unique_embeddings(texts, "doc")
+
+    # Solo los textos que no están en ningún lado van a la API, y se cachean
+    assert service.api_calls == [["nuevo 1", "nuevo 2"]]
+    hashes, model, generated = service.vector_db.cache_embeddings.call_args[0]
+    assert hashes == [content_hash("nuevo 1"), content_hash("nuevo 2")]
+    assert model == EMBEDDING_MODEL
+    np.testing.assert_array_equal(generated, np.vstack([_vector("nuevo 1"), _vector("nuevo 2")]))
+
+    np.testing.assert_array_equal(embeddings, np.vstack([_vector(t) for t in texts]))
+
+
+def test_unique_embeddings_all_reused_skip_api():
+    texts = ["almacenado", "en caché"]
+    service = _embedding_service(
+        stored={"almacenado": _vector("almacenado")},
+        cached={content_hash("en caché"): _vector("en caché")}
+    )
+
+    embeddings = service._generate_unique_embeddings(texts, "doc")
+
+    assert service.api_calls == []
+    service.vector_db.cache_embeddings.assert_not_called()
+    np.testing.assert_array_equal(embeddings, np.vstack([_vector(t) for t in texts]))
+
+
+def test_document_embeddings_dedup_with_partial_reuse():
+    texts = ["pie", "almacenado", "nuevo", "pie", "almacenado"]
+    service = _embedding_service(stored={"almacenado": _vector("almacenado")})
+
+    embeddings = service.generate_document_embeddings(texts, "doc")
+
+    assert service.api_calls == [["pie", "nuevo"]]
+    np.testing.assert_array_equal(embeddings, np.vstack([_vector(t) for t in texts]))
+
+
+# ========================
+# StatusService.find_document_id_by_filename
+# ========================
+
+def _status_service(blob_names):
+    """Crea un StatusService cuyo listado de GCS devuelve blob_names."""
+    service = StatusService.__new__(StatusService)
+    service.bucket_name = "bucket"
+    service.status_prefix = "status/"
+    service.client = MagicMock()
+    service.client.list_blobs.side_effect = lambda bucket, prefix: [
+        SimpleNamespace(name=name) for name in blob_names if name.startswith(prefix)
+    ]
+    return service
+
+
+def test_find_document_id_picks_latest_timestamp():
+    service = _status_service([
+        "status/informe.pdf_1700000000.json",
+        "status/informe.pdf_1700000500.json",
+        "status/informe.pdf_1699999999.json",
+    ])
+    assert service.find_document_id_by_filename("informe.pdf") == "informe.pdf_1700000500"
+    service.client.list_blobs.assert_called_once_with("bucket", prefix="status/informe.pdf_")
+
+
+def test_find_document_id_compares_timestamps_numerically():
+    service = _status_service([
+        "status/informe.pdf_999.json",
+        "status/informe.pdf_1000.json",
+    ])
+    assert service.find_document_id_by_filename("informe.pdf") == "informe.pdf_1000"
+
+
+def test_find_document_id_ignores_names_sharing_the_prefix():
+    service = _status_service([
+        "status/informe.pdf_1700000000.json",
+        "status/informe.pdf_v2_1800000000.json",
+        "status/informe.pdf_1800000000.tmp",
+    ])
+    assert service.find_document_id_by_filename("informe.pdf") == "informe.pdf_1700000000"
+
+
+def test_find_document_id_not_found():
+    service = _status_service(["status/otro.pdf_1700000000.json"])
+    assert service.find_document_id_by_filename("informe.pdf") is None
@@ -30,8 +30,8 @@ class GoogleCloudSettings(BaseSettings):
     # DEPRECATED: embeddings/, metadata/, processed/ - Todo migrado a PostgreSQL
     
     # Nombres de archivos en GCS
-    gcs_metadata_name: str = 'metadata.csv'
-    gcs_metadata_summary_name: str = 'metadata_summary.csv'
+    gcs_metadata_name: str = 'metadata.parquet'
+    gcs_metadata_summary_name: str = 'metadata_summary.parquet'
     gcs_config_name: str = 'config.json'
 
     class Config:
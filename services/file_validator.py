@@ -50,10 +50,19 @@ class PDFSecurityValidator:
         # Obtener datos del archivo
         if file_path:
             try:
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
+                # Verificar el tamaño antes de leer: un archivo demasiado
+                # grande se rechaza sin cargarlo en memoria
                 file_size = os.path.getsize(file_path)
                 filename = Path(file_path).name
+                size_check = self._validate_size(file_size)
+                if not size_check["valid"]:
+                    return {
+                        "valid": False,
+                        "error": f"size: {size_check['error']}",
+                        "checks": {"size": size_check}
+                    }
+                with open(file_path, 'rb') as f:
+                    file_data = f.read()
             except Exception as e:
                 return {
                     "valid": False,
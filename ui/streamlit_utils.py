@@ -99,9 +99,9 @@ def validate_file(uploaded_file: Optional[Any]) -> Dict[str, Any]:
         
         # Validación básica de firma PDF (muy permisiva)
         try:
-            # Leer el archivo para validación básica
-            file_data = uploaded_file.read()
-            uploaded_file.seek(0)  # Resetear posición del archivo
+            # El archivo ya está en memoria: getvalue() devuelve sus bytes sin
+            # leer el stream ni mover la posición
+            file_data = uploaded_file.getvalue()
             
             # Verificar que sea un PDF válido (solo firma básica)
             if len(file_data) < 8: